@@ -1,7 +1,12 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.database import init_db
+from app.services.queue_service import init_publisher, close_publisher
+from app.services.outbox_relay import run_outbox_relay
+from app.services.status_consumer import run_status_consumer
+from app.services.status_events import listen_for_status_events
 
 
 @asynccontextmanager
@@ -12,11 +17,22 @@ async def lifespan(app: FastAPI):
     print("📦 Initializing database...")
     await init_db()
     print("✅ Database initialized!")
+    print("🔌 Connecting to RabbitMQ...")
+    await init_publisher()
+    print("✅ RabbitMQ publisher ready!")
+    outbox_relay = asyncio.create_task(run_outbox_relay())
+    status_consumer = asyncio.create_task(run_status_consumer())
+    status_events = asyncio.create_task(listen_for_status_events())
     
     yield
     
     # Shutdown
     print("👋 Shutting down API Gateway...")
+    outbox_relay.cancel()
+    status_consumer.cancel()
+    status_events.cancel()
+    await asyncio.gather(outbox_relay, status_consumer, status_events, return_exceptions=True)
+    await close_publisher()
 
 
 app = FastAPI(
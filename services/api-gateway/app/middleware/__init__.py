@@ -0,0 +1,3 @@
+"""
+Middleware package
+"""
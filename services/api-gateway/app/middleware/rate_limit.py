@@ -0,0 +1,199 @@
+"""
+Distributed token-bucket rate limiting
+
+Buckets live in Redis and are updated atomically by a Lua script, so every
+gateway process shares them. To avoid a Redis round-trip per request, a
+process takes a small lease of tokens from the bucket and spends it
+locally. Leases are only handed out while the bucket holds several more
+leases' worth, so clients anywhere near their limit hit Redis on every
+request, and tokens left in an expired lease go back to the bucket with
+the next call.
+
+A request may cost more tokens than the bucket holds (a large bulk
+submission): it is let through once the bucket is full and leaves the
+bucket in debt, so the caller waits for the full refill afterwards.
+"""
+import time
+from typing import Dict, List, NamedTuple, Optional
+
+from fastapi import HTTPException, Request, Response
+
+from app.config import settings
+from app.utils.cache import get_redis
+
+# KEYS[1] = bucket; ARGV = capacity, refill per second, cost, lease size,
+# lease reserve, returned tokens
+# Puts the returned (unspent) tokens back, then grants the cost once
+# min(cost, capacity) tokens are available, else nothing; a cost above
+# capacity leaves the bucket negative. A lease is added to the grant only
+# if at least the reserve would be left afterwards.
+# Returns {granted, tokens left}.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local lease = tonumber(ARGV[4])
+local reserve = tonumber(ARGV[5])
+local returned = tonumber(ARGV[6])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) / 1000 * rate + returned)
+
+local granted = 0
+if tokens >= math.min(cost, capacity) then
+    granted = cost
+    if lease > 0 and tokens - cost - lease >= reserve then
+        granted = cost + lease
+    end
+    tokens = tokens - granted
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return {granted, tostring(tokens)}
+"""
+
+# Leased tokens not spent within this time are returned to the bucket
+LEASE_TTL_SECONDS = 1.0
+MAX_LOCAL_LEASES = 10000
+# Leases are only taken while the bucket keeps this many leases in reserve
+LEASE_RESERVE = 4
+
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    limit: int
+    remaining: int
+    reset_seconds: int
+    retry_after: int
+
+
+class TokenBucketLimiter:
+    """Token bucket of `limit` requests per `window_seconds`, shared via Redis"""
+
+    def __init__(self, name: str, limit: int, window_seconds: float, lease_fraction: float):
+        self.name = name
+        self.limit = limit
+        self.rate = limit / window_seconds
+        self.lease_size = int(limit * lease_fraction)
+        # key -> [leased tokens, expires at, bucket tokens when leased]
+        self._leases: Dict[str, List[float]] = {}
+        self._script = None
+
+    def _result(self, allowed: bool, tokens: float, cost: int) -> RateLimitResult:
+        # tokens is negative while the bucket is in debt
+        return RateLimitResult(
+            allowed=allowed,
+            limit=self.limit,
+            remaining=max(0, int(tokens)),
+            reset_seconds=int((self.limit - tokens) / self.rate) + 1,
+            retry_after=max(1, int((min(cost, self.limit) - tokens) / self.rate) + 1),
+        )
+
+    async def acquire(self, key: str, cost: int = 1) -> RateLimitResult:
+        now = time.monotonic()
+
+        # Local pre-check: spend a previously leased share of the bucket
+        lease = self._leases.get(key)
+        if lease and lease[1] > now and lease[0] >= cost:
+            lease[0] -= cost
+            return self._result(True, lease[2] + lease[0], cost)
+
+        # An expired or too small lease goes back to the bucket with this call
+        returned = int(self._leases.pop(key)[0]) if lease else 0
+
+        if self._script is None:
+            client = await get_redis()
+            self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+        granted, tokens_left = await self._script(
+            keys=[f"ratelimit:{self.name}:{key}"],
+            args=[self.limit, self.rate, cost, self.lease_size, self.lease_size * LEASE_RESERVE, returned],
+        )
+        granted = int(granted)
+        tokens_left = float(tokens_left)
+
+        if granted < cost:
+            return self._result(False, tokens_left, cost)
+
+        if granted > cost:
+            if len(self._leases) >= MAX_LOCAL_LEASES:
+                self._leases = {k: v for k, v in self._leases.items() if v[1] > now}
+            self._leases[key] = [granted - cost, now + LEASE_TTL_SECONDS, tokens_left]
+        return self._result(True, tokens_left + granted - cost, cost)
+
+
+client_limiter = TokenBucketLimiter(
+    "client",
+    limit=settings.api_rate_limit,
+    window_seconds=settings.api_rate_limit_window_seconds,
+    lease_fraction=settings.rate_limit_lease_fraction,
+)
+
+user_limiter: Optional[TokenBucketLimiter] = (
+    TokenBucketLimiter(
+        "user",
+        limit=settings.user_rate_limit,
+        window_seconds=settings.api_rate_limit_window_seconds,
+        lease_fraction=settings.rate_limit_lease_fraction,
+    )
+    if settings.user_rate_limit > 0
+    else None
+)
+
+
+def client_key(request: Request) -> str:
+    """Identify the caller by API key header, falling back to client IP"""
+    api_key = request.headers.get(settings.rate_limit_client_header)
+    if api_key:
+        return f"key:{api_key}"
+    return f"ip:{request.client.host if request.client else 'unknown'}"
+
+
+def _headers(result: RateLimitResult) -> Dict[str, str]:
+    return {
+        "X-RateLimit-Limit": str(result.limit),
+        "X-RateLimit-Remaining": str(result.remaining),
+        "X-RateLimit-Reset": str(result.reset_seconds),
+    }
+
+
+async def _check(limiter: TokenBucketLimiter, key: str, cost: int) -> Optional[RateLimitResult]:
+    # Fail open: an unavailable Redis must not take the gateway down
+    try:
+        return await limiter.acquire(key, cost)
+    except Exception as e:
+        print(f"⚠️ Rate limiter unavailable: {e}")
+        return None
+
+
+async def enforce_rate_limit(request: Request, response: Response, cost: int = 1):
+    """Charge the calling client `cost` tokens, raising 429 when out of tokens"""
+    result = await _check(client_limiter, client_key(request), cost)
+    if result is None:
+        return
+    headers = _headers(result)
+    if not result.allowed:
+        headers["Retry-After"] = str(result.retry_after)
+        raise HTTPException(status_code=429, detail="Rate limit exceeded", headers=headers)
+    response.headers.update(headers)
+
+
+async def enforce_user_rate_limit(user_id: str, cost: int = 1):
+    """Charge a target user_id `cost` tokens (when USER_RATE_LIMIT is set)"""
+    if user_limiter is None:
+        return
+    result = await _check(user_limiter, user_id, cost)
+    if result is not None and not result.allowed:
+        headers = _headers(result)
+        headers["Retry-After"] = str(result.retry_after)
+        raise HTTPException(status_code=429, detail=f"Rate limit exceeded for user {user_id}", headers=headers)
+
+
+async def rate_limit(request: Request, response: Response):
+    """Route dependency: one token per request"""
+    await enforce_rate_limit(request, response)
@@ -4,6 +4,7 @@ from app.models.notification import (
     NotificationRequest,
     NotificationStatus,
     NotificationStatusUpdate,
+    NotificationStatusBatchRequest,
     UserData
 )
 from app.models.response import ApiResponse, PaginationMeta
@@ -13,6 +14,7 @@ __all__ = [
     'NotificationRequest',
     'NotificationStatus',
     'NotificationStatusUpdate',
+    'NotificationStatusBatchRequest',
     'UserData',
     'ApiResponse',
     'PaginationMeta',
@@ -1,7 +1,8 @@
 
 from datetime import datetime
 from typing import Optional
-from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
+from sqlmodel import SQLModel, Field, JSON, Column
 from enum import Enum
 
 
@@ -31,12 +32,19 @@ class NotificationLog(SQLModel, table=True):
     delivered_at: Optional[datetime] = None
 
 
-# Example: You can add more models as needed
-# class RateLimitLog(SQLModel, table=True):
-#     """Track rate limits per user"""
-#     __tablename__ = "rate_limit_logs"
-#     
-#     id: Optional[int] = Field(default=None, primary_key=True)
-#     user_id: str = Field(index=True)
-#     request_count: int = Field(default=0)
-#     window_start: datetime = Field(default_factory=datetime.utcnow)
+class OutboxMessage(SQLModel, table=True):
+    """Queue message written in the same transaction as its NotificationLog"""
+
+    __tablename__ = "outbox_messages"
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    notification_id: str = Field(index=True, unique=True)
+    payload: dict = Field(sa_column=Column(JSON, nullable=False))
+    priority: int = Field(default=1)
+    attempts: int = Field(default=0)
+    last_error: Optional[str] = None
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+
+
+# Relay order: highest priority first, then oldest (confirmed rows are deleted)
+Index("ix_outbox_messages_relay_order", OutboxMessage.priority.desc(), OutboxMessage.id)
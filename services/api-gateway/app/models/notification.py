@@ -2,8 +2,8 @@
 Notification models
 """
 from enum import Enum
-from typing import Optional, Dict
-from pydantic import BaseModel, HttpUrl
+from typing import Optional, Dict, List
+from pydantic import BaseModel, Field, HttpUrl
 
 
 class NotificationType(str, Enum):
@@ -43,3 +43,9 @@ class NotificationStatusUpdate(BaseModel):
     status: NotificationStatus
     timestamp: Optional[str] = None
     error: Optional[str] = None
+    retry_count: Optional[int] = None
+
+
+class NotificationStatusBatchRequest(BaseModel):
+    """Batch status lookup request model"""
+    notification_ids: List[str] = Field(min_length=1)
@@ -1,20 +1,63 @@
 """
 Notification routes with database integration
 """
-from fastapi import APIRouter, HTTPException, Depends
+import asyncio
+from collections import Counter
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
+import json
 import uuid
 from datetime import datetime
+from typing import Any, List, Optional, Tuple
 
-from app.models import NotificationRequest, ApiResponse
-from app.models.db_models import NotificationLog
-from app.database import get_session
+from app.models import NotificationRequest, NotificationStatusBatchRequest, ApiResponse
+from app.models.db_models import NotificationLog, OutboxMessage
+from app.config import settings
+from app.database import engine, get_session
+from app.middleware.rate_limit import enforce_rate_limit, enforce_user_rate_limit, rate_limit
+from app.services.idempotency import (
+    Claim,
+    claim_request,
+    release_request,
+    remember_request,
+    remember_requests,
+)
+from app.services.outbox_relay import notify_outbox
+from app.services.queue_service import build_notification_message
+from app.services.status_cache import STATUS_COLUMNS, cache_statuses, get_cached_statuses, status_record
+from app.services.status_events import status_event_stream
 
 router = APIRouter(prefix="/notifications", tags=["notifications"])
 
+# Rows per multi-row INSERT (stays well under the asyncpg parameter limit)
+INSERT_CHUNK_SIZE = 1000
 
-@router.post("/", response_model=ApiResponse)
+
+async def find_by_request_id(session: AsyncSession, request_id: str):
+    """Look up a notification log by its idempotency key"""
+    result = await session.execute(
+        select(NotificationLog).where(NotificationLog.request_id == request_id)
+    )
+    return result.scalar_one_or_none()
+
+
+def idempotent_response(notification_id: str, status: str) -> dict:
+    return {
+        "success": True,
+        "message": "Notification already processed (idempotent)",
+        "data": {
+            "notification_id": notification_id,
+            "status": status
+        }
+    }
+
+
+@router.post("/", response_model=ApiResponse, dependencies=[Depends(rate_limit)])
 async def send_notification(
     notification: NotificationRequest,
     session: AsyncSession = Depends(get_session)
@@ -23,30 +66,34 @@ async def send_notification(
     Send a notification request
     
     Steps:
-    1. Check idempotency (request_id) - prevents duplicate sends
-    2. Create notification log in database
+    1. Check idempotency (request_id) - Redis claim, database as fallback
+    2. Create notification log and its outbox message in one transaction
     3. TODO: Validate user_id (call User Service)
     4. TODO: Validate template_code (call Template Service)
-    5. TODO: Route to appropriate queue (email/push)
+    5. Outbox relay routes it to the appropriate queue (email/push)
     """
-    # Check if request_id already exists (idempotency)
-    result = await session.execute(
-        select(NotificationLog).where(NotificationLog.request_id == notification.request_id)
-    )
-    existing = result.scalar_one_or_none()
-    
-    if existing:
-        return {
-            "success": True,
-            "message": "Notification already processed (idempotent)",
-            "data": {
-                "notification_id": existing.notification_id,
-                "status": existing.status
-            }
-        }
+    await enforce_user_rate_limit(notification.user_id)
     
-    # Create new notification log
     notification_id = str(uuid.uuid4())
+    
+    # Claim request_id in Redis (idempotency fast path)
+    claim = Claim(claimed=False)
+    try:
+        claim = await claim_request(notification.request_id)
+    except Exception as e:
+        print(f"⚠️ Idempotency cache unavailable, using database: {e}")
+    
+    # Replay of a completed request: answered from the record alone
+    if claim.notification_id:
+        return idempotent_response(claim.notification_id, claim.status)
+    
+    # Without a Redis claim, check the database (idempotency)
+    if not claim.claimed:
+        existing = await find_by_request_id(session, notification.request_id)
+        if existing:
+            return idempotent_response(existing.notification_id, existing.status)
+    
+    # Create new notification log
     log = NotificationLog(
         notification_id=notification_id,
         request_id=notification.request_id,
@@ -57,11 +104,45 @@ async def send_notification(
         priority=notification.priority,
     )
     
+    outbox = OutboxMessage(
+        notification_id=notification_id,
+        payload=build_notification_message(notification_id, notification),
+        priority=notification.priority,
+    )
+    
     session.add(log)
-    await session.commit()
-    await session.refresh(log)
+    session.add(outbox)
+    try:
+        await session.commit()
+    except IntegrityError:
+        # Lost a race (or the Redis claim had expired): the durable row wins
+        await session.rollback()
+        existing = await find_by_request_id(session, notification.request_id)
+        if not existing:
+            raise
+        try:
+            await remember_request(notification.request_id, existing.notification_id, existing.status)
+        except Exception as e:
+            print(f"⚠️ Could not cache idempotency record: {e}")
+        return idempotent_response(existing.notification_id, existing.status)
+    except BaseException:
+        # Includes cancellation; the claim would otherwise only expire
+        if claim.claimed:
+            try:
+                await release_request(notification.request_id, claim.token)
+            except Exception as e:
+                print(f"⚠️ Could not release idempotency claim: {e}")
+        raise
+    
+    # Hand off to the outbox relay
+    notify_outbox()
+    
+    # Replays are answered from Redis from now on
+    try:
+        await remember_request(notification.request_id, notification_id)
+    except Exception as e:
+        print(f"⚠️ Could not cache idempotency record: {e}")
     
-    # TODO: Publish to RabbitMQ queue
     # TODO: Call User Service to validate user
     # TODO: Call Template Service to get template
     
@@ -75,33 +156,335 @@ async def send_notification(
     }
 
 
-@router.get("/{notification_id}/status", response_model=ApiResponse)
+def _parse_json_line(line: bytes) -> Tuple[Any, Optional[str]]:
+    try:
+        return json.loads(line), None
+    except ValueError as e:
+        return None, f"Invalid JSON: {e}"
+
+
+async def read_batch_items(request: Request) -> List[Tuple[Any, Optional[str]]]:
+    """
+    Read a bulk request body as (item, parse error) pairs
+
+    Accepts a JSON array, or NDJSON (one request per line) when sent with
+    Content-Type: application/x-ndjson; NDJSON is parsed while streaming.
+    """
+    max_size = settings.notification_batch_max_size
+    too_large = HTTPException(status_code=413, detail=f"Batch exceeds {max_size} notifications")
+    
+    if "ndjson" in request.headers.get("content-type", ""):
+        items = []
+        buffer = b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    items.append(_parse_json_line(line))
+            if len(items) > max_size:
+                raise too_large
+        if buffer.strip():
+            items.append(_parse_json_line(buffer))
+        if len(items) > max_size:
+            raise too_large
+        return items
+    
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if not isinstance(body, list):
+        raise HTTPException(status_code=400, detail="Body must be a JSON array or NDJSON")
+    if len(body) > max_size:
+        raise too_large
+    return [(item, None) for item in body]
+
+
+@router.post("/batch", response_model=ApiResponse)
+async def send_notifications_batch(
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Send many notification requests in one call
+    
+    Valid items are stored with one multi-row INSERT ... ON CONFLICT
+    (request_id) DO NOTHING plus one outbox INSERT in the same transaction,
+    and the outbox relay publishes them in bulk. Returns one result per
+    item, in request order: queued, duplicate, invalid or rate_limited.
+    The caller is charged one rate-limit token per item, invalid items
+    included.
+    """
+    # A client already over its limit is turned away before the body is parsed
+    await enforce_rate_limit(request, response)
+    items = await read_batch_items(request)
+    if not items:
+        raise HTTPException(status_code=400, detail="Batch is empty")
+    if len(items) > 1:
+        await enforce_rate_limit(request, response, cost=len(items) - 1)
+    
+    results: List[dict] = []
+    accepted = {}  # request_id -> (notification_id, NotificationRequest)
+    for index, (item, error) in enumerate(items):
+        result = {"index": index, "request_id": None, "status": "invalid", "notification_id": None, "error": error}
+        results.append(result)
+        if error:
+            continue
+        try:
+            notification = NotificationRequest.model_validate(item)
+        except ValidationError as e:
+            result["error"] = "; ".join(
+                f"{'.'.join(str(part) for part in err['loc'])}: {err['msg']}" for err in e.errors()
+            )
+            continue
+        result["request_id"] = notification.request_id
+        if notification.request_id not in accepted:
+            accepted[notification.request_id] = (str(uuid.uuid4()), notification)
+    
+    # Per-user limits: drop every item of a user that is over its limit
+    per_user = Counter(notification.user_id for _, notification in accepted.values())
+    checks = await asyncio.gather(
+        *(enforce_user_rate_limit(user_id, cost) for user_id, cost in per_user.items()),
+        return_exceptions=True,
+    )
+    limited_users = {
+        user_id for user_id, check in zip(per_user, checks)
+        if isinstance(check, HTTPException)
+    }
+    if limited_users:
+        limited = {
+            request_id for request_id, (_, notification) in accepted.items()
+            if notification.user_id in limited_users
+        }
+        for result in results:
+            if result["request_id"] in limited:
+                result["status"] = "rate_limited"
+                result["error"] = "Rate limit exceeded for user"
+        accepted = {k: v for k, v in accepted.items() if k not in limited}
+    
+    inserted = set()
+    if accepted:
+        now = datetime.utcnow()
+        rows = [
+            {
+                "notification_id": notification_id,
+                "request_id": request_id,
+                "user_id": notification.user_id,
+                "notification_type": notification.notification_type.value,
+                "template_code": notification.template_code,
+                "status": "pending",
+                "priority": notification.priority,
+                "retry_count": 0,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for request_id, (notification_id, notification) in accepted.items()
+        ]
+        for start in range(0, len(rows), INSERT_CHUNK_SIZE):
+            inserted_rows = await session.execute(
+                insert(NotificationLog)
+                .values(rows[start:start + INSERT_CHUNK_SIZE])
+                .on_conflict_do_nothing(index_elements=["request_id"])
+                .returning(NotificationLog.request_id)
+            )
+            inserted.update(inserted_rows.scalars().all())
+        
+        outbox_rows = [
+            {
+                "notification_id": accepted[request_id][0],
+                "payload": build_notification_message(*accepted[request_id]),
+                "priority": accepted[request_id][1].priority,
+                "attempts": 0,
+                "created_at": now,
+            }
+            for request_id in accepted
+            if request_id in inserted
+        ]
+        for start in range(0, len(outbox_rows), INSERT_CHUNK_SIZE):
+            await session.execute(
+                insert(OutboxMessage).values(outbox_rows[start:start + INSERT_CHUNK_SIZE])
+            )
+        
+        # Request_ids that already existed keep their original notification
+        existing = {}
+        duplicates = [request_id for request_id in accepted if request_id not in inserted]
+        if duplicates:
+            existing_rows = await session.execute(
+                select(NotificationLog.request_id, NotificationLog.notification_id, NotificationLog.status)
+                .where(NotificationLog.request_id.in_(duplicates))
+            )
+            existing = {row.request_id: (row.notification_id, row.status) for row in existing_rows}
+        
+        await session.commit()
+        if inserted:
+            notify_outbox()
+            try:
+                await remember_requests({
+                    request_id: accepted[request_id][0] for request_id in inserted
+                })
+            except Exception as e:
+                print(f"⚠️ Could not cache idempotency records: {e}")
+        
+        # Fill in per-item results (repeats within the batch are duplicates)
+        seen = set()
+        for result in results:
+            request_id = result["request_id"]
+            if request_id not in accepted:
+                continue
+            if request_id in inserted and request_id not in seen:
+                result["status"] = "queued"
+                result["notification_id"] = accepted[request_id][0]
+            else:
+                result["status"] = "duplicate"
+                result["notification_id"] = (
+                    accepted[request_id][0] if request_id in inserted
+                    else existing.get(request_id, (None, None))[0]
+                )
+            seen.add(request_id)
+    
+    queued = sum(1 for result in results if result["status"] == "queued")
+    return {
+        "success": True,
+        "message": f"Queued {queued} of {len(results)} notifications",
+        "data": results
+    }
+
+
+async def load_statuses(session: AsyncSession, notification_ids: List[str]) -> dict:
+    """
+    Status records by notification_id: Redis first, Postgres for misses
+
+    Records read from Postgres are cached for the next poll. Redis errors
+    only cost the cache, never the lookup.
+    """
+    try:
+        records = await get_cached_statuses(notification_ids)
+    except Exception as e:
+        print(f"⚠️ Status cache read failed: {e}")
+        records = {}
+    
+    misses = [notification_id for notification_id in notification_ids if notification_id not in records]
+    if misses:
+        result = await session.execute(
+            select(*STATUS_COLUMNS).where(NotificationLog.notification_id.in_(misses))
+        )
+        loaded = [status_record(row) for row in result]
+        if loaded:
+            try:
+                await cache_statuses(loaded, overwrite=False)
+            except Exception as e:
+                print(f"⚠️ Status cache write failed: {e}")
+        records.update((record["notification_id"], record) for record in loaded)
+    return records
+
+
+@router.post("/status/batch", response_model=ApiResponse, dependencies=[Depends(rate_limit)])
+async def get_notification_statuses(
+    lookup: NotificationStatusBatchRequest,
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Get the status of many notifications in one call
+    
+    Ids are answered from the status cache with one MGET; only misses go
+    to the database. Unknown ids are listed under `missing`.
+    """
+    notification_ids = list(dict.fromkeys(lookup.notification_ids))
+    if len(notification_ids) > settings.status_batch_max_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.status_batch_max_size} notification ids"
+        )
+    
+    records = await load_statuses(session, notification_ids)
+    
+    return {
+        "success": True,
+        "message": f"{len(records)} statuses retrieved",
+        "data": {
+            "statuses": [records[notification_id] for notification_id in notification_ids if notification_id in records],
+            "missing": [notification_id for notification_id in notification_ids if notification_id not in records]
+        }
+    }
+
+
+async def load_initial_statuses(notification_ids: List[str]) -> dict:
+    """
+    Statuses for a new event stream
+
+    Uses its own short-lived session: a request-scoped one would only be
+    closed when the stream ends, holding a pooled connection meanwhile.
+    """
+    async with AsyncSession(engine) as session:
+        return await load_statuses(session, notification_ids)
+
+
+def event_stream_response(request: Request, records: dict) -> StreamingResponse:
+    return StreamingResponse(
+        status_event_stream(request, records),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/events", dependencies=[Depends(rate_limit)])
+async def stream_notifications_events(
+    request: Request,
+    ids: str = Query(..., description="Comma-separated notification ids"),
+):
+    """
+    Stream status changes of several notifications as server-sent events
+    
+    Unknown ids are ignored; the stream ends once every known notification
+    is delivered or failed.
+    """
+    notification_ids = list(dict.fromkeys(part.strip() for part in ids.split(",") if part.strip()))
+    if not notification_ids:
+        raise HTTPException(status_code=400, detail="No notification ids given")
+    if len(notification_ids) > settings.sse_max_ids:
+        raise HTTPException(status_code=413, detail=f"At most {settings.sse_max_ids} notification ids per stream")
+    
+    records = await load_initial_statuses(notification_ids)
+    if not records:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    return event_stream_response(request, records)
+
+
+@router.get("/{notification_id}/events", dependencies=[Depends(rate_limit)])
+async def stream_notification_events(
+    notification_id: str,
+    request: Request,
+):
+    """
+    Stream status changes of a notification as server-sent events
+    
+    Sends the current status first, then each change until the
+    notification is delivered or failed.
+    """
+    records = await load_initial_statuses([notification_id])
+    if not records:
+        raise HTTPException(status_code=404, detail="Notification not found")
+    return event_stream_response(request, records)
+
+
+@router.get("/{notification_id}/status", response_model=ApiResponse, dependencies=[Depends(rate_limit)])
 async def get_notification_status(
     notification_id: str,
     session: AsyncSession = Depends(get_session)
 ):
     """
-    Get notification status from database
+    Get notification status (status cache, then database)
     """
-    result = await session.execute(
-        select(NotificationLog).where(NotificationLog.notification_id == notification_id)
-    )
-    log = result.scalar_one_or_none()
+    records = await load_statuses(session, [notification_id])
+    record = records.get(notification_id)
     
-    if not log:
+    if not record:
         raise HTTPException(status_code=404, detail="Notification not found")
     
     return {
         "success": True,
         "message": "Status retrieved",
-        "data": {
-            "notification_id": log.notification_id,
-            "status": log.status,
-            "notification_type": log.notification_type,
-            "created_at": log.created_at.isoformat(),
-            "updated_at": log.updated_at.isoformat(),
-            "delivered_at": log.delivered_at.isoformat() if log.delivered_at else None,
-            "error_message": log.error_message,
-            "retry_count": log.retry_count
-        }
+        "data": record
     }
@@ -0,0 +1,98 @@
+"""
+Redis-backed idempotency for request_id
+
+A request claims its request_id with an atomic SET NX of a short-lived
+in-progress marker (TTL `idempotency_claim_ttl_seconds`). Only once the
+notification is committed is the marker replaced by the final record,
+the notification_id and its last known status, kept for
+`idempotency_ttl_seconds`. The status consumer refreshes that status, so
+replays are answered from the record alone, without touching Postgres. A
+claim that is never completed simply expires, and the unique constraint
+on notification_logs.request_id stays the durable fallback.
+"""
+import json
+import uuid
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from app.config import settings
+from app.utils.cache import get_redis
+
+# KEYS[1] = idempotency key, ARGV[1] = claim token
+# Deletes the key only while it still holds this claim
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class Claim(NamedTuple):
+    claimed: bool
+    # Token to release the claim with (when claimed)
+    token: Optional[str] = None
+    # notification_id and last known status of an earlier, completed request
+    notification_id: Optional[str] = None
+    status: Optional[str] = None
+
+
+def _key(request_id: str) -> str:
+    return f"idempotency:{request_id}"
+
+
+def _record(notification_id: str, status: str) -> str:
+    return json.dumps({"notification_id": notification_id, "status": status})
+
+
+async def claim_request(request_id: str) -> Claim:
+    """
+    Claim a request_id for a new notification
+
+    Not claimed and no notification_id means another request holds the
+    claim (or the record expired meanwhile): check the database.
+    """
+    client = await get_redis()
+    token = json.dumps({"claim": uuid.uuid4().hex})
+    if await client.set(_key(request_id), token, nx=True, ex=settings.idempotency_claim_ttl_seconds):
+        return Claim(claimed=True, token=token)
+    existing = await client.get(_key(request_id))
+    record = json.loads(existing) if existing else {}
+    return Claim(
+        claimed=False,
+        notification_id=record.get("notification_id"),
+        status=record.get("status", "pending"),
+    )
+
+
+async def remember_request(request_id: str, notification_id: str, status: str = "pending"):
+    """Store the notification created for a request_id (after commit)"""
+    client = await get_redis()
+    await client.set(_key(request_id), _record(notification_id, status), ex=settings.idempotency_ttl_seconds)
+
+
+async def remember_requests(notification_ids: Dict[str, str]):
+    """Store request_id -> notification_id of many new requests in one round-trip"""
+    client = await get_redis()
+    async with client.pipeline(transaction=False) as pipe:
+        for request_id, notification_id in notification_ids.items():
+            pipe.set(_key(request_id), _record(notification_id, "pending"), ex=settings.idempotency_ttl_seconds)
+        await pipe.execute()
+
+
+async def refresh_request_statuses(statuses: Dict[str, Tuple[str, str]]):
+    """
+    Update the status in existing records: request_id -> (notification_id, status)
+
+    Records that expired are not recreated and keep their original TTL.
+    """
+    client = await get_redis()
+    async with client.pipeline(transaction=False) as pipe:
+        for request_id, (notification_id, status) in statuses.items():
+            pipe.set(_key(request_id), _record(notification_id, status), xx=True, keepttl=True)
+        await pipe.execute()
+
+
+async def release_request(request_id: str, token: str):
+    """Drop a claim whose notification could not be created"""
+    client = await get_redis()
+    await client.eval(RELEASE_SCRIPT, 1, _key(request_id), token)
@@ -0,0 +1,81 @@
+"""
+Transactional outbox relay
+
+Notifications are written to `outbox_messages` in the same transaction as
+their NotificationLog. This relay drains the rows in batches, highest
+priority first (FOR UPDATE SKIP LOCKED, so several gateway processes can
+run it side by side), publishes them with confirms and deletes the
+confirmed rows in one DELETE, so the table only holds what is still
+unpublished. Delivery to RabbitMQ is at-least-once: a message is only
+republished if the relay dies between the broker confirm and the delete.
+"""
+import asyncio
+
+from sqlalchemy import delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+
+from app.config import settings
+from app.database import engine
+from app.models.db_models import OutboxMessage
+from app.services.queue_service import publish_notifications
+
+_wakeup = asyncio.Event()
+
+
+def notify_outbox():
+    """Wake the relay right away instead of waiting for the next poll"""
+    _wakeup.set()
+
+
+async def relay_batch() -> int:
+    """Publish one batch of outbox rows; returns how many were confirmed"""
+    async with AsyncSession(engine) as session:
+        async with session.begin():
+            result = await session.execute(
+                select(OutboxMessage)
+                .order_by(OutboxMessage.priority.desc(), OutboxMessage.id)
+                .limit(settings.outbox_batch_size)
+                .with_for_update(skip_locked=True)
+            )
+            rows = result.scalars().all()
+            if not rows:
+                return 0
+
+            errors = await publish_notifications([row.payload for row in rows])
+
+            sent_ids = [row.id for row, error in zip(rows, errors) if error is None]
+            if sent_ids:
+                await session.execute(
+                    delete(OutboxMessage).where(OutboxMessage.id.in_(sent_ids))
+                )
+            for row, error in zip(rows, errors):
+                if error is not None:
+                    row.attempts += 1
+                    row.last_error = str(error)[:500]
+
+    failed = len(rows) - len(sent_ids)
+    if failed:
+        print(f"⚠️ Outbox relay: {failed}/{len(rows)} messages not confirmed, will retry")
+    return len(sent_ids)
+
+
+async def run_outbox_relay():
+    """Drain the outbox continuously (started with the application)"""
+    while True:
+        _wakeup.clear()
+        try:
+            count = await relay_batch()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Outbox relay failed: {e}")
+            await asyncio.sleep(settings.outbox_poll_interval_seconds)
+            continue
+
+        # A fully confirmed batch means there is probably more waiting
+        if count < settings.outbox_batch_size:
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=settings.outbox_poll_interval_seconds)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,143 @@
+"""
+RabbitMQ publisher for notification queues
+
+One robust connection is opened at startup and shared by all requests.
+Publishes are spread round-robin over a small pool of channels in
+publisher-confirm mode; concurrent publishes on the same channel share
+the broker's (multiple) acks, so confirms are batched across requests
+without any request holding a channel exclusively.
+
+Each notification type has three priority lanes: `<queue>.high`,
+`<queue>` (normal) and `<queue>.low`, picked from the request priority.
+Workers weight consumption across the lanes, so urgent messages never
+wait behind a bulk campaign.
+"""
+import asyncio
+import itertools
+import json
+from typing import Dict, List, Optional
+
+import aio_pika
+from aio_pika.abc import AbstractChannel, AbstractRobustConnection
+
+from app.config import settings
+from app.models import NotificationRequest
+
+QUEUE_NAMES: Dict[str, str] = {
+    "email": settings.email_queue_name,
+    "push": settings.push_queue_name,
+}
+
+PRIORITY_LANES = ("high", "normal", "low")
+
+_connection: Optional[AbstractRobustConnection] = None
+_channels: List[AbstractChannel] = []
+_channel_cycle: Optional[itertools.cycle] = None
+
+
+async def init_publisher():
+    """Connect to RabbitMQ and open the channel pool"""
+    global _connection, _channel_cycle
+    _connection = await aio_pika.connect_robust(
+        host=settings.rabbitmq_host,
+        port=settings.rabbitmq_port,
+        login=settings.rabbitmq_user,
+        password=settings.rabbitmq_password,
+        virtualhost=settings.rabbitmq_vhost,
+    )
+    for _ in range(settings.rabbitmq_channel_pool_size):
+        _channels.append(await _connection.channel(publisher_confirms=True))
+    _channel_cycle = itertools.cycle(_channels)
+
+    for queue_name in QUEUE_NAMES.values():
+        for lane in PRIORITY_LANES:
+            await _channels[0].declare_queue(lane_queue_name(queue_name, lane), durable=True)
+
+
+async def open_channel(prefetch_count: int) -> AbstractChannel:
+    """Open a consumer channel on the shared connection"""
+    if _connection is None:
+        raise RuntimeError("Publisher is not connected")
+    channel = await _connection.channel()
+    await channel.set_qos(prefetch_count=prefetch_count)
+    return channel
+
+
+async def close_publisher():
+    """Close the channel pool and the connection"""
+    global _connection, _channel_cycle
+    _channels.clear()
+    _channel_cycle = None
+    if _connection is not None:
+        await _connection.close()
+        _connection = None
+
+
+def lane_for(priority: int) -> str:
+    """Priority lane for a request priority"""
+    if priority >= settings.priority_high_threshold:
+        return "high"
+    if priority <= settings.priority_low_threshold:
+        return "low"
+    return "normal"
+
+
+def lane_queue_name(queue_name: str, lane: str) -> str:
+    """Queue of a lane; the normal lane keeps the plain queue name"""
+    return queue_name if lane == "normal" else f"{queue_name}.{lane}"
+
+
+def queue_for(notification_type: str, priority: int = 1) -> str:
+    """Queue a notification is routed to"""
+    return lane_queue_name(QUEUE_NAMES[notification_type], lane_for(priority))
+
+
+def build_notification_message(notification_id: str, notification: NotificationRequest) -> dict:
+    """Queue payload consumed by the email and push workers"""
+    user_data = notification.variables
+    variables = {"name": user_data.name, "link": str(user_data.link)}
+    for key, value in (user_data.meta or {}).items():
+        if value is not None:
+            variables[key] = str(value)
+
+    return {
+        "notification_id": notification_id,
+        "request_id": notification.request_id,
+        "notification_type": notification.notification_type.value,
+        "user_id": notification.user_id,
+        "template_code": notification.template_code,
+        "variables": variables,
+        "priority": notification.priority,
+        "metadata": notification.metadata,
+        "retry_count": 0,
+    }
+
+
+async def publish_notification(message: dict):
+    """Publish one notification and wait for the broker to confirm it"""
+    if _channel_cycle is None:
+        raise RuntimeError("Publisher is not connected")
+    channel = next(_channel_cycle)
+    await channel.default_exchange.publish(
+        aio_pika.Message(
+            body=json.dumps(message).encode(),
+            content_type="application/json",
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            message_id=message["notification_id"],
+        ),
+        routing_key=queue_for(message["notification_type"], message.get("priority", 1)),
+        timeout=settings.publish_timeout_seconds,
+    )
+
+
+async def publish_notifications(messages: List[dict]) -> List[Optional[BaseException]]:
+    """
+    Publish many notifications concurrently and wait for all confirms
+
+    Returns one entry per message: None if confirmed, else the error.
+    """
+    results = await asyncio.gather(
+        *(publish_notification(message) for message in messages),
+        return_exceptions=True,
+    )
+    return [result if isinstance(result, BaseException) else None for result in results]
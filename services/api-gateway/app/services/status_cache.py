@@ -0,0 +1,76 @@
+"""
+Short-lived Redis cache of notification status records
+
+The status consumer writes every record it updates (write-through), so
+polling clients are answered from Redis while a notification is in
+flight. Reads that miss fall back to Postgres and fill the cache with
+SET NX, which never overwrites a fresher write-through record.
+"""
+import json
+from typing import Any, Dict, Iterable, List
+
+from app.config import settings
+from app.models.db_models import NotificationLog
+from app.utils.cache import get_redis
+
+# Columns a status record is built from
+STATUS_COLUMNS = (
+    NotificationLog.notification_id,
+    NotificationLog.status,
+    NotificationLog.notification_type,
+    NotificationLog.created_at,
+    NotificationLog.updated_at,
+    NotificationLog.delivered_at,
+    NotificationLog.error_message,
+    NotificationLog.retry_count,
+)
+
+
+def _key(notification_id: str) -> str:
+    return f"notification:status:{notification_id}"
+
+
+def status_record(row: Any) -> dict:
+    """Status payload for a NotificationLog (or a row with its status columns)"""
+    return {
+        "notification_id": row.notification_id,
+        "status": row.status,
+        "notification_type": row.notification_type,
+        "created_at": row.created_at.isoformat(),
+        "updated_at": row.updated_at.isoformat(),
+        "delivered_at": row.delivered_at.isoformat() if row.delivered_at else None,
+        "error_message": row.error_message,
+        "retry_count": row.retry_count,
+    }
+
+
+async def get_cached_statuses(notification_ids: List[str]) -> Dict[str, dict]:
+    """Cached records for many notifications in one MGET; misses are left out"""
+    if not notification_ids:
+        return {}
+    client = await get_redis()
+    values = await client.mget([_key(notification_id) for notification_id in notification_ids])
+    return {
+        notification_id: json.loads(value)
+        for notification_id, value in zip(notification_ids, values)
+        if value
+    }
+
+
+async def cache_statuses(records: Iterable[dict], overwrite: bool = True):
+    """
+    Cache status records in one round-trip
+
+    `overwrite=False` is for records read from the database, so they
+    never replace one written by the status pipeline in the meantime.
+    """
+    client = await get_redis()
+    async with client.pipeline(transaction=False) as pipe:
+        for record in records:
+            pipe.set(
+                _key(record["notification_id"]),
+                json.dumps(record),
+                ex=settings.status_cache_ttl_seconds,
+                nx=not overwrite,
+            )
+        await pipe.execute()
@@ -0,0 +1,186 @@
+"""
+Delivery status consumer
+
+Workers publish one status event per delivery attempt to
+`status_queue_name`. Events are buffered here, collapsed to the latest
+state per notification, and written to notification_logs with a single
+UPDATE ... FROM (VALUES ...) every `status_flush_interval_ms` (or as soon
+as `status_flush_max_batch` events are waiting). Messages are acked only
+after their batch is committed, so a crash replays them instead of
+losing them. Updated records are also written through to the Redis
+status cache and to the request_id idempotency records, and broadcast to
+the SSE streams.
+"""
+import asyncio
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+from aio_pika.abc import AbstractIncomingMessage
+from pydantic import ValidationError
+from sqlalchemy import DateTime, Integer, String, column, func, update, values
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import engine
+from app.models import NotificationStatus, NotificationStatusUpdate
+from app.models.db_models import NotificationLog
+from app.services.idempotency import refresh_request_statuses
+from app.services.queue_service import open_channel
+from app.services.status_cache import STATUS_COLUMNS, cache_statuses, status_record
+from app.services.status_events import publish_status_events
+
+# Rows per UPDATE statement (6 bind parameters each)
+UPDATE_CHUNK_SIZE = 1000
+
+
+def _to_row(event: NotificationStatusUpdate) -> dict:
+    try:
+        timestamp = datetime.fromisoformat(event.timestamp) if event.timestamp else datetime.utcnow()
+    except ValueError:
+        timestamp = datetime.utcnow()
+    return {
+        "notification_id": event.notification_id,
+        "status": event.status.value,
+        "error_message": event.error,
+        "retry_count": event.retry_count or 0,
+        "delivered_at": timestamp if event.status == NotificationStatus.delivered else None,
+        "updated_at": timestamp,
+    }
+
+
+def _merge(rows: Dict[str, dict], row: dict):
+    """Keep the latest state per notification; delivered is final"""
+    current = rows.get(row["notification_id"])
+    if current is not None:
+        if current["status"] == NotificationStatus.delivered.value:
+            return
+        row["retry_count"] = max(row["retry_count"], current["retry_count"])
+    rows[row["notification_id"]] = row
+
+
+async def apply_status_updates(rows: List[dict]) -> List[Tuple[str, dict]]:
+    """
+    Write a batch of status rows to notification_logs
+
+    Returns (request_id, status record) for every updated notification.
+    """
+    updated = []
+    async with AsyncSession(engine) as session:
+        async with session.begin():
+            for start in range(0, len(rows), UPDATE_CHUNK_SIZE):
+                incoming = values(
+                    column("notification_id", String),
+                    column("status", String),
+                    column("error_message", String),
+                    column("retry_count", Integer),
+                    column("delivered_at", DateTime),
+                    column("updated_at", DateTime),
+                    name="incoming",
+                ).data([
+                    (
+                        row["notification_id"],
+                        row["status"],
+                        row["error_message"],
+                        row["retry_count"],
+                        row["delivered_at"],
+                        row["updated_at"],
+                    )
+                    for row in rows[start:start + UPDATE_CHUNK_SIZE]
+                ])
+                result = await session.execute(
+                    update(NotificationLog)
+                    .where(NotificationLog.notification_id == incoming.c.notification_id)
+                    # Never move a delivered notification back, nor a final one to pending
+                    .where(NotificationLog.status != NotificationStatus.delivered.value)
+                    .where(
+                        (NotificationLog.status == NotificationStatus.pending.value)
+                        | (incoming.c.status != NotificationStatus.pending.value)
+                    )
+                    .values(
+                        status=incoming.c.status,
+                        error_message=incoming.c.error_message,
+                        retry_count=func.greatest(NotificationLog.retry_count, incoming.c.retry_count),
+                        delivered_at=func.coalesce(incoming.c.delivered_at, NotificationLog.delivered_at),
+                        updated_at=incoming.c.updated_at,
+                    )
+                    .returning(NotificationLog.request_id, *STATUS_COLUMNS)
+                    .execution_options(synchronize_session=False)
+                )
+                updated.extend((row.request_id, status_record(row)) for row in result)
+    return updated
+
+
+async def run_status_consumer():
+    """Consume status events and flush them in batches (started with the application)"""
+    channel = await open_channel(settings.status_prefetch_count)
+    queue = await channel.declare_queue(settings.status_queue_name, durable=True)
+
+    pending: Dict[str, dict] = {}
+    messages: List[AbstractIncomingMessage] = []
+    batch_full = asyncio.Event()
+
+    async def on_message(message: AbstractIncomingMessage):
+        try:
+            event = NotificationStatusUpdate.model_validate_json(message.body)
+        except ValidationError as e:
+            print(f"❌ Discarding malformed status event: {e}")
+            await message.reject(requeue=False)
+            return
+        _merge(pending, _to_row(event))
+        messages.append(message)
+        if len(messages) >= settings.status_flush_max_batch:
+            batch_full.set()
+
+    async def flush():
+        nonlocal pending, messages
+        if not messages:
+            return
+        rows, batch = list(pending.values()), messages
+        pending, messages = {}, []
+        try:
+            updated = await apply_status_updates(rows)
+        except Exception as e:
+            print(f"❌ Failed to apply {len(rows)} status updates: {e}")
+            for message in batch:
+                await message.nack(requeue=True)
+            return
+        for message in batch:
+            await message.ack()
+
+        records = [record for _, record in updated]
+        if records:
+            try:
+                await cache_statuses(records)
+            except Exception as e:
+                print(f"⚠️ Failed to cache {len(records)} status records: {e}")
+            try:
+                await refresh_request_statuses({
+                    request_id: (record["notification_id"], record["status"])
+                    for request_id, record in updated
+                })
+            except Exception as e:
+                print(f"⚠️ Failed to refresh {len(records)} idempotency records: {e}")
+            try:
+                await publish_status_events(records)
+            except Exception as e:
+                print(f"⚠️ Failed to publish {len(records)} status events: {e}")
+
+    consumer_tag = await queue.consume(on_message)
+    print(f"✅ Listening to {settings.status_queue_name}...")
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(batch_full.wait(), timeout=settings.status_flush_interval_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            batch_full.clear()
+            try:
+                await flush()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Status flush failed: {e}")
+    finally:
+        await queue.cancel(consumer_tag)
+        await flush()
+        await channel.close()
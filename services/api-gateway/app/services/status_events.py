@@ -0,0 +1,145 @@
+"""
+Status change fan-out for server-sent event streams
+
+The status consumer publishes every updated record to one Redis channel.
+Each gateway process keeps a single subscription to it and hands the
+records to the local SSE connections watching those notifications. Every
+connection keeps only the latest unsent record per notification, so a
+slow client skips intermediate statuses but never misses the final one.
+"""
+import asyncio
+import json
+import time
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set
+
+from fastapi import Request
+
+from app.config import settings
+from app.services.status_cache import get_cached_statuses
+from app.utils.cache import get_redis
+
+STATUS_EVENTS_CHANNEL = "notification:status:events"
+
+FINAL_STATUSES = {"delivered", "failed"}
+
+
+class StatusSubscription:
+    """Pending status changes of one connection, coalesced per notification"""
+
+    def __init__(self):
+        self._latest: Dict[str, dict] = {}
+        self._changed = asyncio.Event()
+
+    def put(self, record: dict):
+        self._latest[record["notification_id"]] = record
+        self._changed.set()
+
+    async def get(self, timeout: Optional[float] = None) -> List[dict]:
+        """Wait for changes and take the latest record of each notification"""
+        await asyncio.wait_for(self._changed.wait(), timeout=timeout)
+        self._changed.clear()
+        records = list(self._latest.values())
+        self._latest.clear()
+        return records
+
+
+_subscribers: Dict[str, Set[StatusSubscription]] = {}
+
+
+def subscribe(notification_ids: Iterable[str]) -> StatusSubscription:
+    """Register a connection for status changes of the given notifications"""
+    subscription = StatusSubscription()
+    for notification_id in notification_ids:
+        _subscribers.setdefault(notification_id, set()).add(subscription)
+    return subscription
+
+
+def unsubscribe(subscription: StatusSubscription, notification_ids: Iterable[str]):
+    for notification_id in notification_ids:
+        subscriptions = _subscribers.get(notification_id)
+        if subscriptions is None:
+            continue
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            del _subscribers[notification_id]
+
+
+def dispatch(record: dict):
+    """Hand a status record to every local connection watching it"""
+    for subscription in _subscribers.get(record["notification_id"], ()):
+        subscription.put(record)
+
+
+async def publish_status_events(records: List[dict]):
+    """Broadcast updated status records to every gateway process"""
+    client = await get_redis()
+    async with client.pipeline(transaction=False) as pipe:
+        for record in records:
+            pipe.publish(STATUS_EVENTS_CHANNEL, json.dumps(record))
+        await pipe.execute()
+
+
+def format_event(record: dict) -> str:
+    return f"event: status\ndata: {json.dumps(record)}\n\n"
+
+
+async def status_event_stream(request: Request, records: Dict[str, dict]) -> AsyncIterator[str]:
+    """
+    SSE body for the given notifications (`records` holds their current status)
+
+    Sends the current status of each notification, then every change,
+    and ends once all of them are delivered or failed, the client goes
+    away, or `sse_max_duration_seconds` is reached (clients reconnect).
+    Comment lines keep idle connections open through proxies.
+    """
+    notification_ids = list(records)
+    subscription = subscribe(notification_ids)
+    try:
+        # Re-read after subscribing so a change made in between is not missed
+        try:
+            records.update(await get_cached_statuses(notification_ids))
+        except Exception as e:
+            print(f"⚠️ Status cache read failed: {e}")
+
+        pending = set()
+        for notification_id, record in records.items():
+            yield format_event(record)
+            if record["status"] not in FINAL_STATUSES:
+                pending.add(notification_id)
+
+        deadline = time.monotonic() + settings.sse_max_duration_seconds
+        while pending and not await request.is_disconnected():
+            timeout = min(settings.sse_heartbeat_seconds, deadline - time.monotonic())
+            if timeout <= 0:
+                break
+            try:
+                changes = await subscription.get(timeout=timeout)
+            except asyncio.TimeoutError:
+                yield ": keepalive\n\n"
+                continue
+            for record in changes:
+                yield format_event(record)
+                if record["status"] in FINAL_STATUSES:
+                    pending.discard(record["notification_id"])
+    finally:
+        unsubscribe(subscription, notification_ids)
+
+
+async def listen_for_status_events():
+    """Feed local SSE connections from Redis pub/sub (started with the application)"""
+    while True:
+        try:
+            client = await get_redis()
+            pubsub = client.pubsub()
+            await pubsub.subscribe(STATUS_EVENTS_CHANNEL)
+            try:
+                async for message in pubsub.listen():
+                    if message["type"] == "message" and _subscribers:
+                        dispatch(json.loads(message["data"]))
+            finally:
+                await pubsub.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Status event listener failed: {e}")
+            await asyncio.sleep(1)
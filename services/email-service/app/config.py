@@ -14,6 +14,12 @@ class Settings(BaseSettings):
     smtp_user: str = ""
     smtp_password: str = ""
     smtp_from_name: str = "Notification System"
+    smtp_timeout: float = 30.0
+    
+    # SMTP connection pool
+    smtp_pool_size: int = 10
+    smtp_max_messages_per_connection: int = 100
+    smtp_health_check_seconds: int = 30  # NOOP connections idle for longer
     
     # RabbitMQ
     rabbitmq_host: str = "localhost"
@@ -22,6 +28,17 @@ class Settings(BaseSettings):
     rabbitmq_password: str = "guest"
     rabbitmq_vhost: str = "/"
     email_queue_name: str = "email.queue"
+    status_queue_name: str = "notification.status.queue"
+    
+    # Consumer
+    worker_prefetch_count: int = 200
+    worker_concurrency: int = 100
+    
+    # Priority lanes (email.queue.high, email.queue, email.queue.low):
+    # relative share of free processing slots (and of prefetch beyond worker_concurrency)
+    lane_weight_high: int = 8
+    lane_weight_normal: int = 3
+    lane_weight_low: int = 1
     
     # Redis
     redis_host: str = "localhost"
@@ -33,12 +50,68 @@ class Settings(BaseSettings):
     template_service_url: str = "http://localhost:8004"
     api_gateway_url: str = "http://localhost:8000"
     
+    # HTTP Clients (shared connection pools)
+    http_max_connections: int = 100
+    http_max_keepalive_connections: int = 50
+    http_keepalive_expiry: float = 30.0
+    http_timeout: float = 10.0
+    http_connect_timeout: float = 5.0
+    http2_enabled: bool = False
+    
+    # User lookups (coalesced into batch calls)
+    user_batch_max_size: int = 100
+    user_batch_window_ms: int = 5
+    
+    # Local user cache (invalidated by the User Service over Redis pub/sub, 0 = off)
+    local_user_cache_size: int = 10000
+    local_user_cache_max_bytes: int = 8388608
+    local_user_cache_ttl_seconds: int = 300
+    
+    # Template renders (coalesced into batch calls)
+    template_batch_max_size: int = 100
+    template_batch_window_ms: int = 5
+    
+    # Template rendering: "remote" (Template Service) or "local" (in-process)
+    template_render_mode: str = "remote"
+    local_template_cache_size: int = 1024
+    local_template_refresh_seconds: int = 30
+    
+    # Provider circuit breaker
+    breaker_window_size: int = 50
+    breaker_min_calls: int = 20
+    breaker_failure_rate: float = 0.5
+    breaker_slow_call_seconds: float = 5.0
+    breaker_slow_call_rate: float = 0.8
+    breaker_open_seconds: float = 30.0
+    breaker_half_open_calls: int = 5
+    
+    # Provider adaptive concurrency (AIMD)
+    provider_concurrency_initial: int = 20
+    provider_concurrency_min: int = 1
+    provider_concurrency_max: int = 200
+    provider_concurrency_backoff: float = 0.7
+    provider_acquire_timeout_seconds: float = 1.0
+    
+    # Provider rate limits (requests per second shared by all replicas, 0 = off)
+    smtp_rate_limit_per_second: float = 0
+    smtp_rate_burst: int = 0  # 0 = one second's worth
+    provider_rate_lease_seconds: float = 0.1
+    provider_rate_max_wait_seconds: float = 5.0
+    
+    # Delivery logs (buffered, written with multi-row upserts)
+    log_batch_size: int = 500
+    log_flush_interval_ms: int = 500
+    log_buffer_max_size: int = 5000
+    log_backpressure_timeout_seconds: float = 5.0
+    
     # Retry Configuration
     max_retry_attempts: int = 3
     retry_delay_seconds: int = 5
+    retry_jitter: float = 0.2
     
     # Logging
     log_level: str = "info"
+    metrics_log_interval_seconds: int = 60
     
     class Config:
         env_file = ".env"
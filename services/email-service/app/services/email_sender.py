@@ -2,11 +2,17 @@ import aiosmtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from app.config import settings
+from app.services.smtp_pool import get_smtp_pool
+from app.utils.circuit_breaker import get_breaker
+from app.utils.provider_limiter import get_provider_limiter
 
 
 async def send_email(to_email: str, subject: str, body: str) -> bool:
     """
-    Send email via Gmail SMTP
+    Send email via Gmail SMTP over a pooled connection
+
+    A pooled connection the server has dropped in the meantime is
+    replaced and the send tried once more.
     """
     try:
         # Create message
@@ -21,15 +27,20 @@ async def send_email(to_email: str, subject: str, body: str) -> bool:
         message.attach(text_part)
         message.attach(html_part)
         
-        # Send via Gmail SMTP
-        await aiosmtplib.send(
-            message,
-            hostname=settings.smtp_host,
-            port=settings.smtp_port,
-            username=settings.smtp_user,
-            password=settings.smtp_password,
-            use_tls=True,
-        )
+        # Stay under the sending quota: wait for a token rather than get a 421
+        limiter = get_provider_limiter("smtp")
+        if limiter is not None:
+            await limiter.acquire()
+        
+        # Send via Gmail SMTP; a refused recipient says nothing about the server
+        pool = get_smtp_pool()
+        async with get_breaker("smtp").guard(ignore=(aiosmtplib.SMTPRecipientsRefused,)):
+            try:
+                async with pool.connection() as conn:
+                    await conn.smtp.send_message(message)
+            except aiosmtplib.SMTPServerDisconnected:
+                async with pool.connection() as conn:
+                    await conn.smtp.send_message(message)
         
         return True
     except Exception as e:
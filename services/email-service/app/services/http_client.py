@@ -0,0 +1,54 @@
+"""
+Process-wide registry of pooled HTTP clients
+
+Each downstream service gets one long-lived httpx.AsyncClient so that
+connections are kept alive and reused across messages instead of paying
+a TCP/TLS handshake per call.
+"""
+import httpx
+from typing import Dict
+from app.config import settings
+
+# Base URL for every named client
+SERVICE_URLS: Dict[str, str] = {
+    "user": settings.user_service_url,
+    "template": settings.template_service_url,
+}
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _build_client(base_url: str) -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        base_url=base_url,
+        http2=settings.http2_enabled,
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(settings.http_timeout, connect=settings.http_connect_timeout),
+    )
+
+
+def init_http_clients():
+    """Create all pooled clients (called on worker startup)"""
+    for name, base_url in SERVICE_URLS.items():
+        if name not in _clients:
+            _clients[name] = _build_client(base_url)
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """Get the pooled client for a service, creating it on first use"""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _build_client(SERVICE_URLS[name])
+    return client
+
+
+async def close_http_clients():
+    """Close all pooled clients (called on worker shutdown)"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
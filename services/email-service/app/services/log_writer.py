@@ -0,0 +1,109 @@
+"""
+Batched delivery log writer
+
+Workers record every delivery attempt, but one INSERT per message would
+cost more than the delivery itself. Rows are buffered in memory (one per
+notification_id, later attempts replace earlier ones) and written with a
+single multi-row INSERT ... ON CONFLICT (notification_id) DO UPDATE once
+`log_batch_size` rows are waiting or every `log_flush_interval_ms`.
+
+When the database falls behind and the buffer reaches `log_buffer_max_size`,
+`record` blocks, which slows message consumption down to what the
+database can take; after `log_backpressure_timeout_seconds` the row is
+dropped so deliveries never stall on logging alone.
+"""
+import asyncio
+from typing import Dict, List, Type
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import SQLModel
+
+from app.config import settings
+from app.database import engine
+
+
+class LogWriter:
+    """
+    Buffer log rows for `model` and upsert them in batches
+
+    On conflict `update_columns` take the new value, `fill_columns` only
+    when the new value is not empty (a later attempt may fail before the
+    recipient is known), and a `sent` row is never downgraded.
+    """
+
+    def __init__(self, model: Type[SQLModel], update_columns: List[str], fill_columns: List[str]):
+        self.model = model
+        self.update_columns = update_columns
+        self.fill_columns = fill_columns
+        self._buffer: Dict[str, dict] = {}
+        self._flush_now = asyncio.Event()
+        self._drained = asyncio.Event()
+
+    async def record(self, row: dict):
+        """Buffer one row, waiting for room if the buffer is full"""
+        notification_id = row["notification_id"]
+        if notification_id not in self._buffer and len(self._buffer) >= settings.log_buffer_max_size:
+            self._flush_now.set()
+            self._drained.clear()
+            try:
+                await asyncio.wait_for(self._drained.wait(), timeout=settings.log_backpressure_timeout_seconds)
+            except asyncio.TimeoutError:
+                print(f"⚠️ Log buffer full, dropping log row for {notification_id}")
+                return
+
+        previous = self._buffer.get(notification_id)
+        if previous is not None:
+            for column in self.fill_columns:
+                if not row.get(column):
+                    row[column] = previous[column]
+            row["created_at"] = previous["created_at"]
+        self._buffer[notification_id] = row
+        if len(self._buffer) >= settings.log_batch_size:
+            self._flush_now.set()
+
+    async def _write(self, rows: List[dict]):
+        stmt = insert(self.model).values(rows)
+        table = self.model.__table__.c
+        values = {column: stmt.excluded[column] for column in self.update_columns}
+        for column in self.fill_columns:
+            values[column] = func.coalesce(func.nullif(stmt.excluded[column], ""), table[column])
+        values["status"] = case((table.status == "sent", table.status), else_=stmt.excluded.status)
+        values["sent_at"] = func.coalesce(stmt.excluded.sent_at, table.sent_at)
+        async with AsyncSession(engine) as session:
+            async with session.begin():
+                await session.execute(
+                    stmt.on_conflict_do_update(index_elements=["notification_id"], set_=values)
+                )
+
+    async def flush(self):
+        """Write everything buffered, in batches of `log_batch_size`"""
+        while self._buffer:
+            batch = dict(list(self._buffer.items())[:settings.log_batch_size])
+            for notification_id in batch:
+                del self._buffer[notification_id]
+            try:
+                await self._write(list(batch.values()))
+            except Exception as e:
+                print(f"❌ Failed to write {len(batch)} log rows: {e}")
+                # Put them back unless a newer attempt replaced them meanwhile
+                for notification_id, row in batch.items():
+                    self._buffer.setdefault(notification_id, row)
+                return
+            finally:
+                if len(self._buffer) < settings.log_buffer_max_size:
+                    self._drained.set()
+
+    async def run(self):
+        """Flush on size or time (started with the consumer)"""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=settings.log_flush_interval_ms / 1000)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+            if self._buffer:
+                # The database refused the batch: back off before retrying
+                await asyncio.sleep(settings.log_flush_interval_ms / 1000)
@@ -0,0 +1,127 @@
+"""
+Pool of authenticated SMTP connections
+
+Connecting, TLS and AUTH cost more than sending a message, so connections
+are kept open and shared by all concurrent sends. A connection is checked
+with NOOP when it has been idle for `smtp_health_check_seconds`, replaced
+when it fails, and recycled after `smtp_max_messages_per_connection`
+messages (providers cap messages per session).
+"""
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional
+
+import aiosmtplib
+
+from app.config import settings
+
+
+class PooledSMTPConnection:
+    __slots__ = ("smtp", "sent", "last_used")
+
+    def __init__(self, smtp: aiosmtplib.SMTP):
+        self.smtp = smtp
+        self.sent = 0
+        self.last_used = time.monotonic()
+
+
+class SMTPPool:
+    """At most `size` connections, idle ones reused most-recently-used first"""
+
+    def __init__(self, size: int, max_messages: int, health_check_seconds: float):
+        self.max_messages = max_messages
+        self.health_check_seconds = health_check_seconds
+        self._slots = asyncio.Semaphore(size)
+        self._idle: List[PooledSMTPConnection] = []
+
+    async def _connect(self) -> PooledSMTPConnection:
+        # Implicit TLS on 465, STARTTLS everywhere else
+        implicit_tls = settings.smtp_port == 465
+        smtp = aiosmtplib.SMTP(
+            hostname=settings.smtp_host,
+            port=settings.smtp_port,
+            use_tls=implicit_tls,
+            start_tls=not implicit_tls,
+            timeout=settings.smtp_timeout,
+        )
+        await smtp.connect()
+        if settings.smtp_user:
+            await smtp.login(settings.smtp_user, settings.smtp_password)
+        return PooledSMTPConnection(smtp)
+
+    async def _is_healthy(self, conn: PooledSMTPConnection) -> bool:
+        if not conn.smtp.is_connected:
+            return False
+        if time.monotonic() - conn.last_used < self.health_check_seconds:
+            return True
+        try:
+            await conn.smtp.noop()
+            return True
+        except aiosmtplib.SMTPException:
+            return False
+
+    async def _discard(self, conn: PooledSMTPConnection):
+        try:
+            if conn.smtp.is_connected:
+                await conn.smtp.quit()
+        except (aiosmtplib.SMTPException, OSError):
+            conn.smtp.close()
+
+    async def _checkout(self) -> PooledSMTPConnection:
+        while self._idle:
+            conn = self._idle.pop()
+            if await self._is_healthy(conn):
+                return conn
+            await self._discard(conn)
+        return await self._connect()
+
+    @asynccontextmanager
+    async def connection(self) -> AsyncIterator[PooledSMTPConnection]:
+        """
+        Borrow a connection for one send
+
+        The connection goes back to the pool unless the send failed or it
+        reached `max_messages`, in which case it is closed.
+        """
+        async with self._slots:
+            conn = await self._checkout()
+            try:
+                yield conn
+            except BaseException:
+                await self._discard(conn)
+                raise
+            conn.sent += 1
+            conn.last_used = time.monotonic()
+            if conn.sent >= self.max_messages:
+                await self._discard(conn)
+            else:
+                self._idle.append(conn)
+
+    async def close(self):
+        idle, self._idle = self._idle, []
+        for conn in idle:
+            await self._discard(conn)
+
+
+_pool: Optional[SMTPPool] = None
+
+
+def get_smtp_pool() -> SMTPPool:
+    """Get the process-wide pool, creating it on first use"""
+    global _pool
+    if _pool is None:
+        _pool = SMTPPool(
+            size=settings.smtp_pool_size,
+            max_messages=settings.smtp_max_messages_per_connection,
+            health_check_seconds=settings.smtp_health_check_seconds,
+        )
+    return _pool
+
+
+async def close_smtp_pool():
+    """Close all idle connections (called on worker shutdown)"""
+    global _pool
+    if _pool is not None:
+        await _pool.close()
+        _pool = None
@@ -0,0 +1,68 @@
+"""
+Request coalescing for downstream lookups
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Generic, Hashable, List, Optional, Set, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+
+class RequestCoalescer(Generic[K, V]):
+    """
+    Gather concurrent lookups into batch calls
+
+    Keys requested within `max_wait` seconds of the first pending one (up
+    to `max_batch_size` distinct keys) are resolved together by a single
+    `fetch_batch(keys)` call, which returns a mapping of key -> value.
+    Keys absent from that mapping resolve to None; if the batch call fails
+    every caller in the batch gets the exception.
+    """
+
+    def __init__(
+        self,
+        fetch_batch: Callable[[List[K]], Awaitable[Dict[K, V]]],
+        max_batch_size: int = 100,
+        max_wait: float = 0.005,
+    ):
+        self._fetch_batch = fetch_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._pending: Dict[K, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def get(self, key: K) -> Optional[V]:
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            self._pending[key] = future
+            if len(self._pending) >= self.max_batch_size:
+                self._flush()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.max_wait, self._flush)
+        # Shielded so one cancelled caller does not cancel the shared lookup
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, {}
+        if batch:
+            task = asyncio.create_task(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch: Dict[K, asyncio.Future]):
+        try:
+            results = await self._fetch_batch(list(batch))
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
@@ -0,0 +1,207 @@
+"""
+Per-provider circuit breaker with adaptive concurrency
+
+Every call to a delivery provider (SMTP, FCM, OneSignal) goes through the
+provider's breaker:
+
+- closed: calls pass; over the last `breaker_window_size` calls the
+  failure rate and slow-call rate (slower than `breaker_slow_call_seconds`)
+  are tracked, and crossing either threshold opens the circuit
+- open: calls fail immediately with CircuitOpenError for
+  `breaker_open_seconds`, then the circuit goes half-open
+- half-open: up to `breaker_half_open_calls` probe calls are let through;
+  if they all succeed the circuit closes, any failure re-opens it
+
+On top of that the number of concurrent calls is capped by an AIMD limit:
++1/limit per fast success, times `provider_concurrency_backoff` on a
+failure or slow call (at most once per round of calls). Callers wait up
+to `provider_acquire_timeout_seconds` for a slot and are then shed with
+ProviderUnavailableError, so a degraded provider costs a quick deferral
+instead of a worker blocked on timeouts.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Tuple, Type
+
+from app.config import settings
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderUnavailableError(Exception):
+    """A provider call was refused before being made; defer the message"""
+
+    def __init__(self, provider: str, reason: str):
+        super().__init__(f"{provider} unavailable: {reason}")
+        self.provider = provider
+        self.reason = reason
+
+
+class CircuitOpenError(ProviderUnavailableError):
+    """The provider's circuit is open"""
+
+
+class CircuitBreaker:
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.limit = float(settings.provider_concurrency_initial)
+        self.in_flight = 0
+        self._outcomes: Deque[Tuple[bool, bool]] = deque(maxlen=settings.breaker_window_size)
+        self._opened_at = 0.0
+        self._probes = 0
+        self._probe_successes = 0
+        self._last_decrease = 0.0
+        self._slot_freed = asyncio.Event()
+
+    def _admit(self):
+        if self.state == OPEN:
+            if time.monotonic() - self._opened_at < settings.breaker_open_seconds:
+                raise CircuitOpenError(self.name, "circuit open")
+            self.state = HALF_OPEN
+            self._probes = 0
+            self._probe_successes = 0
+        if self.state == HALF_OPEN:
+            if self._probes >= settings.breaker_half_open_calls:
+                raise CircuitOpenError(self.name, "circuit half-open, probes in flight")
+            self._probes += 1
+
+    def available(self) -> bool:
+        """False while the circuit is open and not yet due for a probe"""
+        return not (
+            self.state == OPEN
+            and time.monotonic() - self._opened_at < settings.breaker_open_seconds
+        )
+
+    async def _acquire_slot(self):
+        deadline = time.monotonic() + settings.provider_acquire_timeout_seconds
+        while self.in_flight >= max(1, int(self.limit)):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise ProviderUnavailableError(self.name, f"concurrency limit {int(self.limit)} reached")
+            self._slot_freed.clear()
+            try:
+                await asyncio.wait_for(self._slot_freed.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+        self.in_flight += 1
+
+    def _open(self):
+        if self.state != OPEN:
+            print(f"🔴 Circuit for {self.name} opened")
+        self.state = OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+
+    def _close(self):
+        print(f"🟢 Circuit for {self.name} closed")
+        self.state = CLOSED
+        self._outcomes.clear()
+
+    def _record(self, failed: bool, slow: bool, started: float):
+        # Adaptive concurrency
+        if failed or slow:
+            # Only calls started after the last decrease may shrink the limit again
+            if started >= self._last_decrease:
+                self.limit = max(
+                    settings.provider_concurrency_min,
+                    self.limit * settings.provider_concurrency_backoff,
+                )
+                self._last_decrease = time.monotonic()
+        else:
+            self.limit = min(settings.provider_concurrency_max, self.limit + 1 / self.limit)
+
+        # Circuit state
+        if self.state == HALF_OPEN:
+            if failed or slow:
+                self._open()
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= settings.breaker_half_open_calls:
+                    self._close()
+        elif self.state == CLOSED:
+            self._outcomes.append((failed, slow))
+            if len(self._outcomes) >= settings.breaker_min_calls:
+                failure_rate, slow_rate = self._rates()
+                if (
+                    failure_rate >= settings.breaker_failure_rate
+                    or slow_rate >= settings.breaker_slow_call_rate
+                ):
+                    self._open()
+
+    def _rates(self) -> Tuple[float, float]:
+        if not self._outcomes:
+            return 0.0, 0.0
+        count = len(self._outcomes)
+        failures = sum(1 for failed, _ in self._outcomes if failed)
+        slow = sum(1 for _, is_slow in self._outcomes if is_slow)
+        return failures / count, slow / count
+
+    @asynccontextmanager
+    async def guard(self, ignore: Tuple[Type[BaseException], ...] = ()) -> AsyncIterator[None]:
+        """
+        Wrap one provider call
+
+        Raises ProviderUnavailableError instead of making the call when the
+        circuit is open or no slot frees up in time. Exceptions listed in
+        `ignore` (e.g. a rejected recipient) do not count as failures.
+        """
+        self._admit()
+        try:
+            await self._acquire_slot()
+        except BaseException:
+            if self.state == HALF_OPEN:
+                self._probes -= 1
+            raise
+
+        started = time.monotonic()
+        failed = True
+        try:
+            yield
+            failed = False
+        except ignore:
+            failed = False
+            raise
+        except asyncio.CancelledError:
+            # Shutdown, not the provider's fault
+            failed = None
+            raise
+        finally:
+            self.in_flight -= 1
+            self._slot_freed.set()
+            if failed is None:
+                if self.state == HALF_OPEN:
+                    self._probes -= 1
+            else:
+                elapsed = time.monotonic() - started
+                self._record(failed, elapsed > settings.breaker_slow_call_seconds, started)
+
+    def snapshot(self) -> dict:
+        failure_rate, slow_rate = self._rates()
+        return {
+            "state": self.state,
+            "concurrency_limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "failure_rate": round(failure_rate, 3),
+            "slow_call_rate": round(slow_rate, 3),
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_breaker(provider: str) -> CircuitBreaker:
+    """Breaker for a provider, created on first use"""
+    breaker = _breakers.get(provider)
+    if breaker is None:
+        breaker = _breakers[provider] = CircuitBreaker(provider)
+    return breaker
+
+
+def breaker_snapshot() -> Dict[str, dict]:
+    """State of every provider breaker (logged with the stage metrics)"""
+    return {name: breaker.snapshot() for name, breaker in _breakers.items()}
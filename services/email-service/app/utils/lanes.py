@@ -0,0 +1,79 @@
+"""
+Priority lanes
+
+The API Gateway routes each notification to one of three queues by
+priority: `<queue>.high`, `<queue>` (normal) and `<queue>.low`. The worker
+consumes all three and hands free processing slots out by weight, so a
+backlog in the low lane can never hold up high-priority messages.
+"""
+import asyncio
+from collections import deque
+from typing import Any, Deque, Dict, Tuple
+
+from app.config import settings
+
+LANES = ("high", "normal", "low")
+
+
+def lane_queue_name(queue_name: str, lane: str) -> str:
+    """Queue of a lane; the normal lane keeps the plain queue name"""
+    return queue_name if lane == "normal" else f"{queue_name}.{lane}"
+
+
+def lane_weights() -> Dict[str, int]:
+    return {
+        "high": settings.lane_weight_high,
+        "normal": settings.lane_weight_normal,
+        "low": settings.lane_weight_low,
+    }
+
+
+def lane_prefetch(lane: str) -> int:
+    """
+    Prefetch of a lane's channel
+
+    Unacked messages count against prefetch, so every lane may hold at
+    least `worker_concurrency` messages and can fill all processing slots
+    on its own; the weights only decide how `worker_prefetch_count` beyond
+    that is buffered, and LaneScheduler decides which lane gets a slot.
+    """
+    weights = lane_weights()
+    share = settings.worker_prefetch_count * weights[lane] // sum(weights.values())
+    return max(settings.worker_concurrency, share)
+
+
+class LaneScheduler:
+    """
+    Smooth weighted round-robin over per-lane buffers
+
+    Only lanes with buffered messages take part in a pick, so an idle lane
+    leaves its share to the others and a lane with weight w gets at least
+    w / sum(weights) of the picks while it has work.
+    """
+
+    def __init__(self, weights: Dict[str, int]):
+        self._weights = weights
+        self._credit = {lane: 0 for lane in weights}
+        self._buffers: Dict[str, Deque[Any]] = {lane: deque() for lane in weights}
+        self._ready = asyncio.Event()
+
+    def put(self, lane: str, item: Any):
+        self._buffers[lane].append(item)
+        self._ready.set()
+
+    async def get(self) -> Tuple[str, Any]:
+        """Wait for a buffered item and return (lane, item) of the next pick"""
+        while True:
+            ready = [lane for lane, buffer in self._buffers.items() if buffer]
+            if ready:
+                break
+            self._ready.clear()
+            await self._ready.wait()
+
+        total = 0
+        for lane in ready:
+            self._credit[lane] += self._weights[lane]
+            total += self._weights[lane]
+        picked = max(ready, key=self._credit.__getitem__)
+        self._credit[picked] -= total
+        return picked, self._buffers[picked].popleft()
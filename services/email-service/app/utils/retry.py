@@ -1,20 +1,85 @@
-import asyncio
-from functools import wraps
-
-
-def retry_with_backoff(max_attempts: int = 3, delay: int = 5):
-    """Retry decorator with exponential backoff"""
-    def decorator(func):
-        @wraps(func)
-        async def wrapper(*args, **kwargs):
-            for attempt in range(max_attempts):
-                try:
-                    return await func(*args, **kwargs)
-                except Exception as e:
-                    if attempt == max_attempts - 1:
-                        raise e
-                    wait_time = delay * (2 ** attempt)
-                    print(f"⚠️ Retry attempt {attempt + 1}/{max_attempts} after {wait_time}s")
-                    await asyncio.sleep(wait_time)
-        return wrapper
-    return decorator
+import json
+import random
+
+import aio_pika
+from aio_pika.abc import AbstractChannel
+
+from app.config import settings
+
+FAILED_QUEUE_NAME = "failed.queue"
+
+
+def retry_queue_name(queue_name: str, attempt: int) -> str:
+    """Name of the delay queue holding messages for the given retry attempt"""
+    return f"{queue_name}.retry.{attempt}"
+
+
+def retry_delay_ms(attempt: int) -> int:
+    """Backoff tier for a retry attempt (1-based): delay * 2**(attempt - 1)"""
+    return int(settings.retry_delay_seconds * 1000 * (2 ** (attempt - 1)))
+
+
+async def declare_retry_queues(channel: AbstractChannel, queue_name: str):
+    """
+    Declare one TTL delay queue per retry attempt
+
+    Nothing consumes these queues: messages sit there until their TTL
+    expires and are then dead-lettered back into `queue_name`.
+    """
+    for attempt in range(1, settings.max_retry_attempts + 1):
+        await channel.declare_queue(
+            retry_queue_name(queue_name, attempt),
+            durable=True,
+            arguments={
+                "x-message-ttl": retry_delay_ms(attempt),
+                "x-dead-letter-exchange": "",
+                "x-dead-letter-routing-key": queue_name,
+            },
+        )
+    await channel.declare_queue(FAILED_QUEUE_NAME, durable=True)
+
+
+async def schedule_retry(channel: AbstractChannel, queue_name: str, message_data: dict) -> bool:
+    """
+    Hand a failed message back to the broker for a delayed retry
+
+    Publishes to the next delay tier with a jittered per-message expiration
+    (never longer than the tier TTL), or to the dead letter queue once
+    `max_retry_attempts` is exhausted. Returns True if a retry was scheduled.
+    """
+    retry_count = message_data.get("retry_count", 0)
+    if retry_count >= settings.max_retry_attempts:
+        routing_key = FAILED_QUEUE_NAME
+        expiration = None
+    else:
+        attempt = retry_count + 1
+        message_data["retry_count"] = attempt
+        routing_key = retry_queue_name(queue_name, attempt)
+        delay_ms = retry_delay_ms(attempt) * random.uniform(1 - settings.retry_jitter, 1)
+        expiration = delay_ms / 1000
+
+    await _publish(channel, routing_key, message_data, expiration)
+    return routing_key != FAILED_QUEUE_NAME
+
+
+async def defer_message(channel: AbstractChannel, queue_name: str, message_data: dict):
+    """
+    Send a message back for a later attempt without using up a retry
+
+    For messages that were never attempted because their provider is
+    unavailable (open circuit, no capacity): they wait in the first delay
+    tier and keep their retry_count.
+    """
+    delay_ms = retry_delay_ms(1) * random.uniform(1 - settings.retry_jitter, 1)
+    await _publish(channel, retry_queue_name(queue_name, 1), message_data, delay_ms / 1000)
+
+
+async def _publish(channel: AbstractChannel, routing_key: str, message_data: dict, expiration):
+    await channel.default_exchange.publish(
+        aio_pika.Message(
+            body=json.dumps(message_data).encode(),
+            delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            expiration=expiration,
+        ),
+        routing_key=routing_key,
+    )
@@ -0,0 +1,45 @@
+"""
+Local rendering of templates compiled by the Template Service
+"""
+from typing import Dict, List, Optional, Tuple
+
+
+class CompiledTemplate:
+    """Literal segments and placeholder slots of one template text"""
+
+    __slots__ = ("_parts", "_slots")
+
+    def __init__(self, parts: List[str], slots: List[Tuple[int, str, str]]):
+        self._parts = parts
+        self._slots = [tuple(slot) for slot in slots]
+
+    def render(self, variables: Dict[str, str]) -> str:
+        parts = self._parts.copy()
+        for index, name, raw in self._slots:
+            value = variables.get(name)
+            parts[index] = raw if value is None else str(value)
+        return "".join(parts)
+
+
+class CompiledNotificationTemplate:
+    """Compiled subject and body of one template version"""
+
+    __slots__ = ("template_code", "version", "subject", "body")
+
+    def __init__(self, data: dict):
+        self.template_code: str = data["template_code"]
+        self.version: int = data["version"]
+        self.subject: Optional[CompiledTemplate] = (
+            CompiledTemplate(**data["subject"]) if data.get("subject") else None
+        )
+        self.body = CompiledTemplate(**data["body"])
+
+    @property
+    def etag(self) -> str:
+        return f'"{self.template_code}:{self.version}"'
+
+    def render(self, variables: Dict[str, str]) -> dict:
+        return {
+            "subject": self.subject.render(variables) if self.subject else None,
+            "body": self.body.render(variables),
+        }
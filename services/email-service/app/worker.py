@@ -1,120 +1,283 @@
 """
 RabbitMQ Consumer Worker
-Listens to email.queue and processes email notifications
+Listens to the email.queue priority lanes and processes email notifications
 """
-import pika
-import json
 import asyncio
+import json
+import signal
 from datetime import datetime
+from typing import Optional
+
+import aio_pika
+from aio_pika.abc import AbstractChannel, AbstractIncomingMessage
+
 from app.config import settings
+from app.database import init_db
+from app.models.db_models import EmailLog
 from app.services.email_sender import send_email
-from app.services.template_client import render_template
-from app.services.user_client import get_user
-from app.utils.retry import retry_with_backoff
+from app.services.http_client import init_http_clients, close_http_clients
+from app.services.log_writer import LogWriter
+from app.services.smtp_pool import close_smtp_pool
+from app.services.status_publisher import publish_status
+from app.services.template_client import listen_for_template_invalidations, render_template
+from app.services.user_client import get_user, listen_for_user_invalidations
+from app.utils.circuit_breaker import ProviderUnavailableError, breaker_snapshot
+from app.utils.lanes import LANES, LaneScheduler, lane_prefetch, lane_queue_name, lane_weights
+from app.utils.metrics import snapshot, timed, track_latency
+from app.utils.retry import declare_retry_queues, defer_message, schedule_retry
+
+
+class NotificationSkipped(Exception):
+    """The notification was deliberately not sent and must not be retried"""
+
 
+# Every attempt is recorded in email_logs through batched upserts
+log_writer = LogWriter(
+    EmailLog,
+    update_columns=["retry_count", "error_message", "updated_at"],
+    fill_columns=["email_to", "subject"],
+)
+
+# Worker status -> email_logs status
+LOG_STATUSES = {"delivered": "sent", "pending": "pending", "failed": "failed"}
+
+
+def new_log_row(message_data: dict) -> dict:
+    now = datetime.utcnow()
+    return {
+        "notification_id": message_data.get("notification_id"),
+        "user_id": str(message_data.get("user_id") or ""),
+        "email_to": "",
+        "subject": "",
+        "template_code": message_data.get("template_code") or "",
+        "status": "pending",
+        "retry_count": 0,
+        "error_message": None,
+        "sent_at": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+async def report_outcome(
+    channel: AbstractChannel,
+    message_data: dict,
+    log: dict,
+    status: str,
+    error: Optional[str] = None,
+):
+    """Publish the status event and record the attempt in email_logs"""
+    await publish_status(channel, message_data, status, error)
+    if not log["notification_id"]:
+        return
+    now = datetime.utcnow()
+    log.update(
+        status=LOG_STATUSES[status],
+        retry_count=message_data.get("retry_count", 0),
+        error_message=error[:500] if error else None,
+        sent_at=now if status == "delivered" else None,
+        updated_at=now,
+    )
+    await log_writer.record(log)
 
-@retry_with_backoff(max_attempts=settings.max_retry_attempts, delay=settings.retry_delay_seconds)
-async def process_email(message_data: dict):
+
+async def process_email(message_data: dict, log: dict):
     """
     Process email notification
+
+    The template render does not depend on the user lookup, so both run
+    concurrently; the render is cancelled if the user has opted out.
+    Recipient and subject are filled into `log` as they become known.
     """
     notification_id = message_data.get("notification_id")
     user_id = message_data.get("user_id")
     template_code = message_data.get("template_code")
     variables = message_data.get("variables", {})
-    
+
     print(f"📧 Processing email notification: {notification_id}")
-    
-    # 1. Get user email from User Service
-    user = await get_user(user_id)
-    if not user or not user.get("email"):
-        raise Exception(f"User {user_id} not found or no email")
-    
-    user_email = user["email"]
-    
-    # Check if user has email preference enabled
-    preferences = user.get("preferences", {})
-    if not preferences.get("email", True):
-        print(f"⚠️ User {user_id} has disabled email notifications")
-        return
-    
-    # 2. Render template
-    rendered = await render_template(template_code, variables)
+
+    # 1. Render template while the user is being fetched
+    render_task = asyncio.create_task(
+        timed("render_template", render_template(template_code, variables))
+    )
+    try:
+        # 2. Get user email from User Service
+        user = await timed("get_user", get_user(user_id))
+        if not user or not user.get("email"):
+            raise Exception(f"User {user_id} not found or no email")
+
+        user_email = user["email"]
+        log["email_to"] = user_email
+
+        # Check if user has email preference enabled
+        preferences = user.get("preferences", {})
+        if not preferences.get("email", True):
+            raise NotificationSkipped(f"User {user_id} has disabled email notifications")
+
+        rendered = await render_task
+    finally:
+        render_task.cancel()
+
     if not rendered:
         raise Exception(f"Failed to render template: {template_code}")
-    
+
     subject = rendered.get("subject", "Notification")
     body = rendered.get("body", "")
-    
+    log["subject"] = subject or ""
+
     # 3. Send email via Gmail
-    await send_email(user_email, subject, body)
-    
+    with track_latency("send_email"):
+        await send_email(user_email, subject, body)
+
     print(f"✅ Email sent successfully to {user_email}")
 
 
-def callback(ch, method, properties, body):
-    """RabbitMQ message callback"""
+async def handle_message(channel: AbstractChannel, queue_name: str, message: AbstractIncomingMessage):
+    """Process a single delivery from `queue_name` and settle it"""
     try:
-        message_data = json.loads(body)
-        print(f"📨 Received message: {message_data.get('notification_id')}")
-        
-        # Run async function
-        asyncio.run(process_email(message_data))
-        
-        # Acknowledge message
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+        message_data = json.loads(message.body)
+    except json.JSONDecodeError as e:
+        print(f"❌ Discarding malformed message: {e}")
+        await message.reject(requeue=False)
+        return
+
+    print(f"📨 Received message: {message_data.get('notification_id')}")
+    log = new_log_row(message_data)
+
+    try:
+        with track_latency("process_email"):
+            await process_email(message_data, log)
+        await report_outcome(channel, message_data, log, "delivered")
+    except NotificationSkipped as e:
+        print(f"⚠️ {e}")
+        await report_outcome(channel, message_data, log, "failed", str(e))
+    except ProviderUnavailableError as e:
+        # Not attempted: come back later without using up a retry
+        print(f"⏸️ {e}, deferring message")
+        await defer_message(channel, queue_name, message_data)
+        await report_outcome(channel, message_data, log, "pending", str(e))
     except Exception as e:
         print(f"❌ Error processing message: {e}")
-        # Reject and requeue with retry limit
-        retry_count = message_data.get("retry_count", 0)
-        if retry_count < settings.max_retry_attempts:
-            message_data["retry_count"] = retry_count + 1
-            ch.basic_publish(
-                exchange='',
-                routing_key=settings.email_queue_name,
-                body=json.dumps(message_data)
-            )
+        # Retry through a broker-side delay queue, ack right away
+        if await schedule_retry(channel, queue_name, message_data):
+            print(f"🔁 Scheduled retry {message_data['retry_count']}/{settings.max_retry_attempts}")
+            await report_outcome(channel, message_data, log, "pending", str(e))
         else:
-            # Send to dead letter queue
-            ch.basic_publish(
-                exchange='',
-                routing_key='failed.queue',
-                body=json.dumps(message_data)
-            )
-        ch.basic_ack(delivery_tag=method.delivery_tag)
+            print("☠️ Retries exhausted, moved to failed.queue")
+            await report_outcome(channel, message_data, log, "failed", str(e))
+
+    await message.ack()
+
 
+async def report_metrics():
+    """Periodically log per-stage latency and provider breaker state"""
+    while True:
+        await asyncio.sleep(settings.metrics_log_interval_seconds)
+        stats = snapshot(reset=True)
+        if stats:
+            print(f"📊 Stage latency: {json.dumps(stats)}")
+        breakers = breaker_snapshot()
+        if breakers:
+            print(f"📊 Providers: {json.dumps(breakers)}")
+
+
+async def start_consumer():
+    """
+    Start RabbitMQ consumer
+
+    Runs a single long-lived event loop. Each priority lane is consumed on
+    its own channel with a weighted share of `worker_prefetch_count`;
+    buffered messages are started as `worker_concurrency` slots free up,
+    picking lanes by weight (see LaneScheduler).
+    """
+    init_http_clients()
+    await init_db()
+    log_flusher = asyncio.create_task(log_writer.run())
 
-def start_consumer():
-    """Start RabbitMQ consumer"""
     print("🔌 Connecting to RabbitMQ...")
-    
-    credentials = pika.PlainCredentials(
-        settings.rabbitmq_user,
-        settings.rabbitmq_password
-    )
-    
-    connection = pika.BlockingConnection(
-        pika.ConnectionParameters(
-            host=settings.rabbitmq_host,
-            port=settings.rabbitmq_port,
-            virtual_host=settings.rabbitmq_vhost,
-            credentials=credentials
-        )
-    )
-    
-    channel = connection.channel()
-    channel.queue_declare(queue=settings.email_queue_name, durable=True)
-    channel.queue_declare(queue='failed.queue', durable=True)
-    
-    channel.basic_qos(prefetch_count=1)
-    channel.basic_consume(
-        queue=settings.email_queue_name,
-        on_message_callback=callback
+
+    connection = await aio_pika.connect_robust(
+        host=settings.rabbitmq_host,
+        port=settings.rabbitmq_port,
+        login=settings.rabbitmq_user,
+        password=settings.rabbitmq_password,
+        virtualhost=settings.rabbitmq_vhost,
     )
-    
-    print(f"✅ Listening to {settings.email_queue_name}...")
-    channel.start_consuming()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    slots = asyncio.Semaphore(settings.worker_concurrency)
+    in_flight = set()
+    scheduler = LaneScheduler(lane_weights())
+
+    def release(task: asyncio.Task):
+        in_flight.discard(task)
+        slots.release()
+
+    async with connection:
+        lanes = {}
+        for lane in LANES:
+            channel = await connection.channel()
+            await channel.set_qos(prefetch_count=lane_prefetch(lane))
+            queue_name = lane_queue_name(settings.email_queue_name, lane)
+            queue = await channel.declare_queue(queue_name, durable=True)
+            await declare_retry_queues(channel, queue_name)
+            lanes[lane] = (channel, queue)
+        await lanes["normal"][0].declare_queue(settings.status_queue_name, durable=True)
+
+        async def consume(lane: str):
+            _, queue = lanes[lane]
+            async with queue.iterator() as messages:
+                async for message in messages:
+                    scheduler.put(lane, message)
+
+        async def dispatch():
+            while True:
+                await slots.acquire()
+                try:
+                    lane, message = await scheduler.get()
+                except BaseException:
+                    slots.release()
+                    raise
+                channel, queue = lanes[lane]
+                task = asyncio.create_task(handle_message(channel, queue.name, message))
+                in_flight.add(task)
+                task.add_done_callback(release)
+
+        consumers = [asyncio.create_task(consume(lane)) for lane in LANES]
+        consumers.append(asyncio.create_task(dispatch()))
+        background = [asyncio.create_task(report_metrics())]
+        if settings.local_user_cache_size > 0:
+            background.append(asyncio.create_task(listen_for_user_invalidations()))
+        if settings.template_render_mode == "local":
+            background.append(asyncio.create_task(listen_for_template_invalidations()))
+        print(f"✅ Listening to {', '.join(queue.name for _, queue in lanes.values())}...")
+
+        stopping = asyncio.create_task(stop.wait())
+        await asyncio.wait([*consumers, stopping], return_when=asyncio.FIRST_COMPLETED)
+
+        # Stop taking new deliveries, let in-flight messages finish;
+        # buffered ones are requeued by the broker when the channels close
+        print("👋 Shutting down consumer...")
+        for task in consumers:
+            task.cancel()
+        stopping.cancel()
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*consumers, stopping, *background, return_exceptions=True)
+        await asyncio.gather(*in_flight, return_exceptions=True)
+
+    # Write whatever is still buffered before exiting
+    log_flusher.cancel()
+    await asyncio.gather(log_flusher, return_exceptions=True)
+    await log_writer.flush()
+
+    await close_http_clients()
+    await close_smtp_pool()
 
 
 if __name__ == "__main__":
-    start_consumer()
+    asyncio.run(start_consumer())
@@ -0,0 +1,287 @@
+"""
+RabbitMQ Consumer Worker
+Listens to the push.queue priority lanes and processes push notifications
+"""
+import asyncio
+import json
+import signal
+from datetime import datetime
+from typing import Optional
+
+import aio_pika
+from aio_pika.abc import AbstractChannel, AbstractIncomingMessage
+
+from app.config import settings
+from app.database import init_db
+from app.models.db_models import PushLog
+from app.services.provider_router import get_router
+from app.services.push_sender import send_push_notification
+from app.services.http_client import init_http_clients, close_http_clients
+from app.services.log_writer import LogWriter
+from app.services.status_publisher import publish_status
+from app.services.template_client import listen_for_template_invalidations, render_template
+from app.services.user_client import get_user, listen_for_user_invalidations
+from app.utils.circuit_breaker import ProviderUnavailableError, breaker_snapshot
+from app.utils.lanes import LANES, LaneScheduler, lane_prefetch, lane_queue_name, lane_weights
+from app.utils.metrics import snapshot, timed, track_latency
+from app.utils.retry import declare_retry_queues, defer_message, schedule_retry
+
+
+class NotificationSkipped(Exception):
+    """The notification was deliberately not sent and must not be retried"""
+
+
+# Every attempt is recorded in push_logs through batched upserts
+log_writer = LogWriter(
+    PushLog,
+    update_columns=["retry_count", "error_message", "updated_at"],
+    fill_columns=["push_token", "title", "message"],
+)
+
+# Worker status -> push_logs status
+LOG_STATUSES = {"delivered": "sent", "pending": "pending", "failed": "failed"}
+
+
+def new_log_row(message_data: dict) -> dict:
+    now = datetime.utcnow()
+    return {
+        "notification_id": message_data.get("notification_id"),
+        "user_id": str(message_data.get("user_id") or ""),
+        "push_token": "",
+        "title": "",
+        "message": "",
+        "template_code": message_data.get("template_code") or "",
+        "status": "pending",
+        "retry_count": 0,
+        "error_message": None,
+        "sent_at": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+
+async def report_outcome(
+    channel: AbstractChannel,
+    message_data: dict,
+    log: dict,
+    status: str,
+    error: Optional[str] = None,
+):
+    """Publish the status event and record the attempt in push_logs"""
+    await publish_status(channel, message_data, status, error)
+    if not log["notification_id"]:
+        return
+    now = datetime.utcnow()
+    log.update(
+        status=LOG_STATUSES[status],
+        retry_count=message_data.get("retry_count", 0),
+        error_message=error[:500] if error else None,
+        sent_at=now if status == "delivered" else None,
+        updated_at=now,
+    )
+    await log_writer.record(log)
+
+
+async def process_push(message_data: dict, log: dict):
+    """
+    Process push notification
+
+    The template render does not depend on the user lookup, so both run
+    concurrently; the render is cancelled if the user has opted out.
+    Token, title and message are filled into `log` as they become known.
+    """
+    notification_id = message_data.get("notification_id")
+    user_id = message_data.get("user_id")
+    template_code = message_data.get("template_code")
+    variables = message_data.get("variables", {})
+
+    print(f"📱 Processing push notification: {notification_id}")
+
+    # 1. Render template while the user is being fetched
+    render_task = asyncio.create_task(
+        timed("render_template", render_template(template_code, variables))
+    )
+    try:
+        # 2. Get user push token from User Service
+        user = await timed("get_user", get_user(user_id))
+        if not user or not user.get("push_token"):
+            raise Exception(f"User {user_id} not found or no push token")
+
+        push_token = user["push_token"]
+        log["push_token"] = push_token
+
+        # Check if user has push preference enabled
+        preferences = user.get("preferences", {})
+        if not preferences.get("push", True):
+            raise NotificationSkipped(f"User {user_id} has disabled push notifications")
+
+        rendered = await render_task
+    finally:
+        render_task.cancel()
+
+    if not rendered:
+        raise Exception(f"Failed to render template: {template_code}")
+
+    title = rendered.get("subject", "Notification")  # Use subject as title
+    body = rendered.get("body", "")
+    log["title"] = title or ""
+    log["message"] = body
+
+    # 3. Send push notification
+    with track_latency("send_push"):
+        await send_push_notification(push_token, title, body)
+
+    print(f"✅ Push sent successfully to {user_id}")
+
+
+async def handle_message(channel: AbstractChannel, queue_name: str, message: AbstractIncomingMessage):
+    """Process a single delivery from `queue_name` and settle it"""
+    try:
+        message_data = json.loads(message.body)
+    except json.JSONDecodeError as e:
+        print(f"❌ Discarding malformed message: {e}")
+        await message.reject(requeue=False)
+        return
+
+    print(f"📨 Received message: {message_data.get('notification_id')}")
+    log = new_log_row(message_data)
+
+    try:
+        with track_latency("process_push"):
+            await process_push(message_data, log)
+        await report_outcome(channel, message_data, log, "delivered")
+    except NotificationSkipped as e:
+        print(f"⚠️ {e}")
+        await report_outcome(channel, message_data, log, "failed", str(e))
+    except ProviderUnavailableError as e:
+        # Not attempted: come back later without using up a retry
+        print(f"⏸️ {e}, deferring message")
+        await defer_message(channel, queue_name, message_data)
+        await report_outcome(channel, message_data, log, "pending", str(e))
+    except Exception as e:
+        print(f"❌ Error processing message: {e}")
+        # Retry through a broker-side delay queue, ack right away
+        if await schedule_retry(channel, queue_name, message_data):
+            print(f"🔁 Scheduled retry {message_data['retry_count']}/{settings.max_retry_attempts}")
+            await report_outcome(channel, message_data, log, "pending", str(e))
+        else:
+            print("☠️ Retries exhausted, moved to failed.queue")
+            await report_outcome(channel, message_data, log, "failed", str(e))
+
+    await message.ack()
+
+
+async def report_metrics():
+    """Periodically log per-stage latency and provider breaker state"""
+    while True:
+        await asyncio.sleep(settings.metrics_log_interval_seconds)
+        stats = snapshot(reset=True)
+        if stats:
+            print(f"📊 Stage latency: {json.dumps(stats)}")
+        breakers = breaker_snapshot()
+        if breakers:
+            print(f"📊 Providers: {json.dumps(breakers)}")
+        router = get_router()
+        if router is not None:
+            print(f"📊 Provider routing: {json.dumps(router.snapshot())}")
+
+
+async def start_consumer():
+    """
+    Start RabbitMQ consumer
+
+    Runs a single long-lived event loop. Each priority lane is consumed on
+    its own channel with a weighted share of `worker_prefetch_count`;
+    buffered messages are started as `worker_concurrency` slots free up,
+    picking lanes by weight (see LaneScheduler).
+    """
+    init_http_clients()
+    await init_db()
+    log_flusher = asyncio.create_task(log_writer.run())
+
+    print("🔌 Connecting to RabbitMQ...")
+
+    connection = await aio_pika.connect_robust(
+        host=settings.rabbitmq_host,
+        port=settings.rabbitmq_port,
+        login=settings.rabbitmq_user,
+        password=settings.rabbitmq_password,
+        virtualhost=settings.rabbitmq_vhost,
+    )
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    slots = asyncio.Semaphore(settings.worker_concurrency)
+    in_flight = set()
+    scheduler = LaneScheduler(lane_weights())
+
+    def release(task: asyncio.Task):
+        in_flight.discard(task)
+        slots.release()
+
+    async with connection:
+        lanes = {}
+        for lane in LANES:
+            channel = await connection.channel()
+            await channel.set_qos(prefetch_count=lane_prefetch(lane))
+            queue_name = lane_queue_name(settings.push_queue_name, lane)
+            queue = await channel.declare_queue(queue_name, durable=True)
+            await declare_retry_queues(channel, queue_name)
+            lanes[lane] = (channel, queue)
+        await lanes["normal"][0].declare_queue(settings.status_queue_name, durable=True)
+
+        async def consume(lane: str):
+            _, queue = lanes[lane]
+            async with queue.iterator() as messages:
+                async for message in messages:
+                    scheduler.put(lane, message)
+
+        async def dispatch():
+            while True:
+                await slots.acquire()
+                try:
+                    lane, message = await scheduler.get()
+                except BaseException:
+                    slots.release()
+                    raise
+                channel, queue = lanes[lane]
+                task = asyncio.create_task(handle_message(channel, queue.name, message))
+                in_flight.add(task)
+                task.add_done_callback(release)
+
+        consumers = [asyncio.create_task(consume(lane)) for lane in LANES]
+        consumers.append(asyncio.create_task(dispatch()))
+        background = [asyncio.create_task(report_metrics())]
+        if settings.local_user_cache_size > 0:
+            background.append(asyncio.create_task(listen_for_user_invalidations()))
+        if settings.template_render_mode == "local":
+            background.append(asyncio.create_task(listen_for_template_invalidations()))
+        print(f"✅ Listening to {', '.join(queue.name for _, queue in lanes.values())}...")
+
+        stopping = asyncio.create_task(stop.wait())
+        await asyncio.wait([*consumers, stopping], return_when=asyncio.FIRST_COMPLETED)
+
+        # Stop taking new deliveries, let in-flight messages finish;
+        # buffered ones are requeued by the broker when the channels close
+        print("👋 Shutting down consumer...")
+        for task in consumers:
+            task.cancel()
+        stopping.cancel()
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*consumers, stopping, *background, return_exceptions=True)
+        await asyncio.gather(*in_flight, return_exceptions=True)
+
+    # Write whatever is still buffered before exiting
+    log_flusher.cancel()
+    await asyncio.gather(log_flusher, return_exceptions=True)
+    await log_writer.flush()
+
+    await close_http_clients()
+
+
+if __name__ == "__main__":
+    asyncio.run(start_consumer())
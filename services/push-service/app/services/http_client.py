@@ -0,0 +1,60 @@
+"""
+Process-wide registry of pooled HTTP clients
+
+Each downstream service and push provider gets one long-lived
+httpx.AsyncClient so that connections are kept alive and reused across
+messages instead of paying a TCP/TLS handshake per call.
+"""
+import httpx
+from typing import Dict
+from app.config import settings
+
+# Base URL for every named client
+SERVICE_URLS: Dict[str, str] = {
+    "user": settings.user_service_url,
+    "template": settings.template_service_url,
+    "fcm": settings.fcm_api_url,
+    "onesignal": settings.onesignal_api_url,
+}
+
+# Push providers multiplex many concurrent sends over HTTP/2
+HTTP2_SERVICES = {"fcm", "onesignal"}
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    http2 = settings.push_http2_enabled if name in HTTP2_SERVICES else settings.http2_enabled
+    return httpx.AsyncClient(
+        base_url=SERVICE_URLS[name],
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=settings.http_max_connections,
+            max_keepalive_connections=settings.http_max_keepalive_connections,
+            keepalive_expiry=settings.http_keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(settings.http_timeout, connect=settings.http_connect_timeout),
+    )
+
+
+def init_http_clients():
+    """Create all pooled clients (called on worker startup)"""
+    for name in SERVICE_URLS:
+        if name not in _clients:
+            _clients[name] = _build_client(name)
+
+
+def get_http_client(name: str) -> httpx.AsyncClient:
+    """Get the pooled client for a service, creating it on first use"""
+    client = _clients.get(name)
+    if client is None or client.is_closed:
+        client = _clients[name] = _build_client(name)
+    return client
+
+
+async def close_http_clients():
+    """Close all pooled clients (called on worker shutdown)"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
@@ -0,0 +1,198 @@
+"""
+Push provider routing
+
+Push tokens are provider-specific: an FCM registration token means
+nothing to OneSignal and vice versa. A token whose format identifies its
+provider (OneSignal player ids are UUIDs, FCM tokens are long
+colon-separated strings) always goes to that provider, however unhealthy
+it is; the circuit breaker then defers the message rather than sending
+it somewhere it cannot be delivered.
+
+Only tokens of unknown format are routed by health. A rolling (EWMA)
+success rate, the share of recipients each request got accepted for, and
+latency are kept per provider:
+
+- failover: the first provider in `push_provider_order` that is healthy
+  (circuit not open, success rate and latency within bounds), else the
+  best-scoring one
+- split: traffic is spread over the healthy providers in proportion to
+  success rate / latency
+
+Stats older than `push_router_recovery_seconds` are forgotten, so a
+provider that was failed away from gets traffic again. With
+`push_sticky_routing` such a device keeps the provider it was first sent
+through; the binding lives in Redis so every worker replica agrees on it,
+and recent bindings are remembered locally in case Redis is unreachable.
+"""
+import random
+import re
+import time
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Optional
+
+from app.config import settings
+from app.utils.cache import get_redis
+from app.utils.circuit_breaker import get_breaker
+
+# Sticky bindings remembered in-process
+LOCAL_BINDINGS_MAX = 10000
+
+ONESIGNAL_PLAYER_ID = re.compile(r"^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$")
+
+
+class ProviderStats:
+    __slots__ = ("success_rate", "latency", "updated_at")
+
+    def __init__(self):
+        self.success_rate = 1.0
+        self.latency: Optional[float] = None
+        self.updated_at = 0.0
+
+    def add(self, accepted: float, seconds: float):
+        alpha = settings.push_router_ewma_alpha
+        if time.monotonic() - self.updated_at > settings.push_router_recovery_seconds:
+            self.success_rate, self.latency = 1.0, None
+        self.success_rate += alpha * (accepted - self.success_rate)
+        self.latency = seconds if self.latency is None else self.latency + alpha * (seconds - self.latency)
+        self.updated_at = time.monotonic()
+
+    @property
+    def stale(self) -> bool:
+        return time.monotonic() - self.updated_at > settings.push_router_recovery_seconds
+
+
+def token_provider(push_token: str) -> Optional[str]:
+    """The provider that issued a token, when its format tells"""
+    if ONESIGNAL_PLAYER_ID.match(push_token):
+        return "onesignal"
+    if ":" in push_token and len(push_token) >= 100:
+        return "fcm"
+    return None
+
+
+def configured_providers() -> List[str]:
+    """Providers with credentials, in preference order"""
+    configured = {
+        "fcm": bool(settings.fcm_server_key),
+        "onesignal": bool(settings.onesignal_app_id and settings.onesignal_api_key),
+    }
+    order = [name.strip() for name in settings.push_provider_order.split(",") if name.strip()]
+    return [name for name in order if configured.get(name)]
+
+
+class ProviderRouter:
+    def __init__(self, providers: List[str]):
+        self.providers = providers
+        self._stats = {provider: ProviderStats() for provider in providers}
+        self._bindings: "OrderedDict[str, str]" = OrderedDict()
+
+    def record(self, provider: str, accepted: float, seconds: float):
+        """
+        Outcome of one provider request: the share of its recipients the
+        provider accepted (0 if the request failed) and its latency
+        """
+        self._stats[provider].add(accepted, seconds)
+
+    def healthy(self, provider: str) -> bool:
+        if not get_breaker(provider).available():
+            return False
+        stats = self._stats[provider]
+        if stats.stale or stats.latency is None:
+            return True
+        return (
+            stats.success_rate >= settings.push_router_min_success_rate
+            and stats.latency * 1000 <= settings.push_router_max_latency_ms
+        )
+
+    def score(self, provider: str) -> float:
+        stats = self._stats[provider]
+        if stats.stale or stats.latency is None:
+            # No recent data: assume a healthy provider at the latency bound
+            return 1000 / settings.push_router_max_latency_ms
+        return stats.success_rate / max(stats.latency, 0.001)
+
+    def pick(self) -> str:
+        healthy = [provider for provider in self.providers if self.healthy(provider)]
+        if not healthy:
+            return max(self.providers, key=self.score)
+        if settings.push_routing_mode == "split":
+            return random.choices(healthy, weights=[self.score(provider) for provider in healthy])[0]
+        return healthy[0]
+
+    def _bind_locally(self, push_token: str, provider: str):
+        self._bindings[push_token] = provider
+        self._bindings.move_to_end(push_token)
+        if len(self._bindings) > LOCAL_BINDINGS_MAX:
+            self._bindings.popitem(last=False)
+
+    async def route(self, push_tokens: List[str]) -> Dict[str, List[str]]:
+        """
+        Assign tokens to providers: provider -> tokens
+
+        Tokens that only an unconfigured provider can serve are left out.
+        """
+        routes: Dict[str, List[str]] = defaultdict(list)
+        unknown = []
+        for token in push_tokens:
+            issuer = token_provider(token)
+            if issuer is None:
+                unknown.append(token)
+            elif issuer in self._stats:
+                routes[issuer].append(token)
+        if not unknown:
+            return routes
+
+        if not settings.push_sticky_routing:
+            for token in unknown:
+                routes[self.pick()].append(token)
+            return routes
+
+        try:
+            client = await get_redis()
+            keys = [f"push:route:{token}" for token in unknown]
+            bound = await client.mget(keys)
+        except Exception as e:
+            print(f"⚠️ Sticky routing unavailable, using local bindings: {e}")
+            client, bound = None, [None] * len(unknown)
+
+        new_bindings = {}
+        for token, provider in zip(unknown, bound):
+            provider = provider or self._bindings.get(token)
+            if provider not in self._stats:
+                provider = self.pick()
+                new_bindings[f"push:route:{token}"] = provider
+            self._bind_locally(token, provider)
+            routes[provider].append(token)
+        if client is not None and new_bindings:
+            try:
+                async with client.pipeline(transaction=False) as pipe:
+                    for key, provider in new_bindings.items():
+                        pipe.set(key, provider, ex=settings.push_sticky_ttl_seconds, nx=True)
+                    await pipe.execute()
+            except Exception as e:
+                print(f"⚠️ Could not store sticky routes: {e}")
+        return routes
+
+    def snapshot(self) -> Dict[str, dict]:
+        return {
+            provider: {
+                "healthy": self.healthy(provider),
+                "success_rate": round(stats.success_rate, 3),
+                "latency_ms": round(stats.latency * 1000, 1) if stats.latency is not None else None,
+            }
+            for provider, stats in self._stats.items()
+        }
+
+
+_router: Optional[ProviderRouter] = None
+
+
+def get_router() -> Optional[ProviderRouter]:
+    """The process-wide router, or None if no provider is configured"""
+    global _router
+    if _router is None:
+        providers = configured_providers()
+        if not providers:
+            return None
+        _router = ProviderRouter(providers)
+    return _router
@@ -1,94 +1,192 @@
+"""
+Push delivery engine
+
+Sends go through the pooled provider clients (HTTP/2 when enabled) and a
+micro-batcher: pushes with the same title, body and data that arrive
+within `push_batch_window_ms` are sent as one multi-recipient request
+(FCM `registration_ids`, OneSignal `include_player_ids`) of up to
+`push_batch_max_size` tokens, and the per-recipient results are mapped
+back to the individual notifications. An identical push to the same
+device within the window is sent once. The provider router picks FCM or
+OneSignal per device (by token format where possible), and provider
+calls go through the provider's circuit breaker; a refused call surfaces
+as ProviderUnavailableError so the messages are deferred, not failed.
+"""
 import asyncio
-import httpx
+import json
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple, Union
+
 from app.config import settings
+from app.services.http_client import get_http_client
+from app.services.provider_router import get_router
+from app.utils.batcher import RequestCoalescer
+from app.utils.circuit_breaker import ProviderUnavailableError, get_breaker
+from app.utils.provider_limiter import get_provider_limiter
+
+# (title, body, data as JSON, push token)
+PushKey = Tuple[str, str, str, str]
+
+
+class PushDeliveryError(Exception):
+    """The provider did not accept the push for this recipient"""
 
 
-async def send_fcm_push(push_token: str, title: str, body: str, data: dict = None) -> bool:
+async def send_fcm_push(push_tokens: List[str], title: str, body: str, data: dict = None) -> Dict[str, Optional[str]]:
     """
-    Send push notification via Firebase Cloud Messaging
+    Send one push to many devices via Firebase Cloud Messaging
+
+    Returns token -> None if accepted, else the error.
     """
-    if not settings.fcm_server_key:
-        print("⚠️ FCM_SERVER_KEY not configured, simulating push send")
-        await asyncio.sleep(0.5)
-        return True
-    
-    try:
-        url = "https://fcm.googleapis.com/fcm/send"
-        headers = {
-            "Authorization": f"Bearer {settings.fcm_server_key}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "to": push_token,
-            "notification": {
-                "title": title,
-                "body": body
-            },
-            "data": data or {}
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, headers=headers, timeout=10.0)
-            if response.status_code == 200:
-                print(f"✅ FCM push sent successfully")
-                return True
-            else:
-                print(f"❌ FCM push failed: {response.text}")
-                return False
-    except Exception as e:
-        print(f"❌ Failed to send FCM push: {e}")
-        raise e
+    client = get_http_client("fcm")
+    headers = {"Authorization": f"Bearer {settings.fcm_server_key}"}
+    payload = {
+        "registration_ids": push_tokens,
+        "notification": {
+            "title": title,
+            "body": body
+        },
+        "data": data or {}
+    }
+    response = await client.post("/fcm/send", json=payload, headers=headers)
+    if response.status_code != 200:
+        raise PushDeliveryError(f"FCM HTTP {response.status_code}: {response.text[:200]}")
 
+    # Results come back in the order of registration_ids
+    results = response.json().get("results", [])
+    return {
+        token: result.get("error") if "message_id" not in result else None
+        for token, result in zip(push_tokens, results)
+    }
 
-async def send_onesignal_push(push_token: str, title: str, body: str, data: dict = None) -> bool:
+
+async def send_onesignal_push(push_tokens: List[str], title: str, body: str, data: dict = None) -> Dict[str, Optional[str]]:
     """
-    Send push notification via OneSignal
+    Send one push to many devices via OneSignal
+
+    Returns token -> None if accepted, else the error.
     """
-    if not settings.onesignal_app_id or not settings.onesignal_api_key:
-        print("⚠️ OneSignal not configured, simulating push send")
-        await asyncio.sleep(0.5)
-        return True
-    
-    try:
-        url = "https://onesignal.com/api/v1/notifications"
-        headers = {
-            "Authorization": f"Basic {settings.onesignal_api_key}",
-            "Content-Type": "application/json"
-        }
-        payload = {
-            "app_id": settings.onesignal_app_id,
-            "include_player_ids": [push_token],
-            "headings": {"en": title},
-            "contents": {"en": body},
-            "data": data or {}
-        }
-        
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload, headers=headers, timeout=10.0)
-            if response.status_code == 200:
-                print(f"✅ OneSignal push sent successfully")
-                return True
+    client = get_http_client("onesignal")
+    headers = {"Authorization": f"Basic {settings.onesignal_api_key}"}
+    payload = {
+        "app_id": settings.onesignal_app_id,
+        "include_player_ids": push_tokens,
+        "headings": {"en": title},
+        "contents": {"en": body},
+        "data": data or {}
+    }
+    response = await client.post("/api/v1/notifications", json=payload, headers=headers)
+    if response.status_code != 200:
+        raise PushDeliveryError(f"OneSignal HTTP {response.status_code}: {response.text[:200]}")
+
+    # Only the rejected recipients are listed
+    errors = response.json().get("errors") or {}
+    invalid = set(errors.get("invalid_player_ids", [])) if isinstance(errors, dict) else set()
+    return {token: "Invalid player id" if token in invalid else None for token in push_tokens}
+
+
+async def simulate_push(push_tokens: List[str], title: str, body: str, data: dict = None) -> Dict[str, Optional[str]]:
+    """Stand-in when no provider is configured (for testing)"""
+    print(f"📱 Simulating push to {len(push_tokens)} device(s): {title} - {body}")
+    await asyncio.sleep(0.5)
+    return {token: None for token in push_tokens}
+
+
+SENDERS = {
+    "fcm": send_fcm_push,
+    "onesignal": send_onesignal_push,
+}
+
+
+async def _call_provider(provider: Optional[str], push_tokens: List[str], title: str, body: str, data: dict):
+    """
+    One provider request, paced by the provider's rate limit and guarded
+    by its circuit breaker
+
+    The share of accepted recipients and the latency feed the provider
+    router. Without any configured provider the send is simulated.
+    """
+    if provider is None:
+        return await simulate_push(push_tokens, title, body, data)
+    limiter = get_provider_limiter(provider)
+    if limiter is not None:
+        await limiter.acquire()
+    router = get_router()
+    async with get_breaker(provider).guard():
+        start = time.perf_counter()
+        try:
+            results = await SENDERS[provider](push_tokens, title, body, data)
+        except Exception:
+            router.record(provider, 0.0, time.perf_counter() - start)
+            raise
+        accepted = sum(1 for token in push_tokens if token in results and results[token] is None)
+        router.record(provider, accepted / len(push_tokens), time.perf_counter() - start)
+        return results
+
+
+async def _send_batch(keys: List[PushKey]) -> Dict[PushKey, Union[bool, str, ProviderUnavailableError]]:
+    """
+    Group pushes by content and send each group as multi-recipient requests
+
+    Returns key -> True if accepted, else the error for that recipient
+    (a ProviderUnavailableError if the request was never made).
+    """
+    router = get_router()
+    providers: Dict[str, Optional[str]] = {}
+    if router is not None:
+        tokens = list(dict.fromkeys(token for _, _, _, token in keys))
+        for provider, routed in (await router.route(tokens)).items():
+            providers.update((token, provider) for token in routed)
+
+    results: Dict[PushKey, Union[bool, str, ProviderUnavailableError]] = {}
+    groups: Dict[Tuple[str, str, str, Optional[str]], List[str]] = defaultdict(list)
+    for title, body, data, token in keys:
+        if router is not None and token not in providers:
+            results[(title, body, data, token)] = "No configured provider can deliver to this push token"
+            continue
+        groups[(title, body, data, providers.get(token))].append(token)
+
+    requests = []
+    for (title, body, data, provider), tokens in groups.items():
+        for start in range(0, len(tokens), settings.push_batch_max_size):
+            chunk = tokens[start:start + settings.push_batch_max_size]
+            request = _call_provider(provider, chunk, title, body, json.loads(data))
+            requests.append(((title, body, data), chunk, request))
+
+    outcomes = await asyncio.gather(*(request for _, _, request in requests), return_exceptions=True)
+
+    for ((title, body, data), chunk, _), outcome in zip(requests, outcomes):
+        for token in chunk:
+            if isinstance(outcome, ProviderUnavailableError):
+                error = outcome
+            elif isinstance(outcome, BaseException):
+                error = f"{type(outcome).__name__}: {outcome}"
             else:
-                print(f"❌ OneSignal push failed: {response.text}")
-                return False
-    except Exception as e:
-        print(f"❌ Failed to send OneSignal push: {e}")
-        raise e
+                error = outcome.get(token, "No result from provider")
+            results[(title, body, data, token)] = error or True
+    return results
+
+
+# Concurrent sends from in-flight messages are merged into multicast calls
+_push_batcher = RequestCoalescer(
+    _send_batch,
+    max_batch_size=settings.push_batch_max_size,
+    max_wait=settings.push_batch_window_ms / 1000,
+)
 
 
 async def send_push_notification(push_token: str, title: str, body: str, data: dict = None) -> bool:
     """
-    Send push notification (auto-select provider)
+    Send push notification (provider picked by the router)
+
+    Raises PushDeliveryError if the provider rejected this recipient, or
+    ProviderUnavailableError if the provider could not be called.
     """
-    # Try FCM first if configured
-    if settings.fcm_server_key:
-        return await send_fcm_push(push_token, title, body, data)
-    
-    # Try OneSignal if configured
-    if settings.onesignal_app_id and settings.onesignal_api_key:
-        return await send_onesignal_push(push_token, title, body, data)
-    
-    # Simulate if no provider configured (for testing)
-    print(f"📱 Simulating push to {push_token}: {title} - {body}")
-    await asyncio.sleep(0.5)
+    key = (title, body, json.dumps(data or {}, sort_keys=True), push_token)
+    result = await _push_batcher.get(key)
+    if isinstance(result, ProviderUnavailableError):
+        raise ProviderUnavailableError(result.provider, result.reason)
+    if result is not True:
+        raise PushDeliveryError(result or "No result from provider")
     return True
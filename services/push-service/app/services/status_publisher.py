@@ -0,0 +1,46 @@
+"""
+Delivery status events sent back to the API Gateway
+
+The gateway consumes `status_queue_name` and applies the events to
+notification_logs in bulk, so publishing here is fire-and-forget: a lost
+event leaves the log behind but never affects delivery.
+"""
+import json
+from datetime import datetime
+from typing import Optional
+
+import aio_pika
+from aio_pika.abc import AbstractChannel
+
+from app.config import settings
+
+
+async def publish_status(
+    channel: AbstractChannel,
+    message_data: dict,
+    status: str,
+    error: Optional[str] = None,
+):
+    """Report the outcome of a delivery attempt (delivered, pending or failed)"""
+    notification_id = message_data.get("notification_id")
+    if not notification_id:
+        return
+
+    event = {
+        "notification_id": notification_id,
+        "status": status,
+        "timestamp": datetime.utcnow().isoformat(),
+        "error": error[:500] if error else None,
+        "retry_count": message_data.get("retry_count", 0),
+    }
+    try:
+        await channel.default_exchange.publish(
+            aio_pika.Message(
+                body=json.dumps(event).encode(),
+                content_type="application/json",
+                delivery_mode=aio_pika.DeliveryMode.PERSISTENT,
+            ),
+            routing_key=settings.status_queue_name,
+        )
+    except Exception as e:
+        print(f"⚠️ Failed to publish status for {notification_id}: {e}")
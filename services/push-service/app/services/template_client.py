@@ -1,38 +1,162 @@
-import httpx
-from typing import Optional, Dict
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple
 from app.config import settings
+from app.services.http_client import get_http_client
+from app.utils.batcher import RequestCoalescer
+from app.utils.cache import get_redis
+from app.utils.template_engine import CompiledNotificationTemplate
+
+# (template_code, variables as canonical JSON)
+RenderKey = Tuple[str, str]
+
+# Channel the Template Service publishes template_codes on when they change
+INVALIDATION_CHANNEL = "template:invalidate"
+
+# Compiled templates for local rendering: template_code -> (template, last validated)
+_local_templates: "OrderedDict[str, Tuple[CompiledNotificationTemplate, float]]" = OrderedDict()
+_template_fetches: Dict[str, asyncio.Task] = {}
 
 
 async def get_template(template_code: str) -> Optional[Dict]:
     """Fetch template from Template Service"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{settings.template_service_url}/api/v1/templates/{template_code}",
-                timeout=10.0
-            )
-            if response.status_code == 200:
-                data = response.json()
-                return data.get("data")
-            return None
+        client = get_http_client("template")
+        response = await client.get(f"/api/v1/templates/{template_code}")
+        if response.status_code == 200:
+            data = response.json()
+            return data.get("data")
+        return None
     except Exception as e:
         print(f"❌ Failed to fetch template: {e}")
         return None
 
 
+async def _render_batch(keys: List[RenderKey]) -> Dict[RenderKey, Dict]:
+    """Render many templates with one call to the Template Service batch endpoint"""
+    client = get_http_client("template")
+    response = await client.post(
+        "/api/v1/templates/render/batch",
+        json={
+            "items": [
+                {"template_code": template_code, "variables": json.loads(variables)}
+                for template_code, variables in keys
+            ]
+        },
+    )
+    response.raise_for_status()
+    if response.headers.get("content-type", "").startswith("application/x-ndjson"):
+        results = [json.loads(line) for line in response.text.splitlines() if line]
+    else:
+        results = response.json()["data"]
+    return {
+        keys[result["index"]]: result["data"]
+        for result in results
+        if result["success"]
+    }
+
+
+# Renders from in-flight messages are coalesced into batch calls
+_render_batcher = RequestCoalescer(
+    _render_batch,
+    max_batch_size=settings.template_batch_max_size,
+    max_wait=settings.template_batch_window_ms / 1000,
+)
+
+
+async def _fetch_compiled_template(
+    template_code: str,
+    cached: Optional[CompiledNotificationTemplate]
+) -> Optional[CompiledNotificationTemplate]:
+    """Fetch (or revalidate) a compiled template from the Template Service"""
+    client = get_http_client("template")
+    headers = {"If-None-Match": cached.etag} if cached else {}
+    response = await client.get(f"/api/v1/templates/{template_code}/compiled", headers=headers)
+    if response.status_code == 304:
+        return cached
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return CompiledNotificationTemplate(response.json()["data"])
+
+
+def _store_local_template(template_code: str, compiled: CompiledNotificationTemplate):
+    _local_templates[template_code] = (compiled, time.monotonic())
+    _local_templates.move_to_end(template_code)
+    if len(_local_templates) > settings.local_template_cache_size:
+        _local_templates.popitem(last=False)
+
+
+async def get_compiled_template(template_code: str) -> Optional[CompiledNotificationTemplate]:
+    """
+    Get a compiled template from the local cache
+
+    Entries are revalidated (by version) every `local_template_refresh_seconds`;
+    if the Template Service is unreachable the cached version keeps being
+    served. Concurrent misses for the same template share one fetch.
+    """
+    entry = _local_templates.get(template_code)
+    if entry:
+        compiled, validated_at = entry
+        if time.monotonic() - validated_at < settings.local_template_refresh_seconds:
+            _local_templates.move_to_end(template_code)
+            return compiled
+    cached = entry[0] if entry else None
+
+    task = _template_fetches.get(template_code)
+    if task is None:
+        task = asyncio.create_task(_fetch_compiled_template(template_code, cached))
+        _template_fetches[template_code] = task
+        task.add_done_callback(lambda _: _template_fetches.pop(template_code, None))
+
+    try:
+        compiled = await asyncio.shield(task)
+    except Exception as e:
+        if cached is None:
+            raise
+        print(f"⚠️ Template Service unavailable, serving cached {template_code}: {e}")
+        _store_local_template(template_code, cached)
+        return cached
+
+    if compiled is None:
+        _local_templates.pop(template_code, None)
+        return None
+    _store_local_template(template_code, compiled)
+    return compiled
+
+
+async def listen_for_template_invalidations():
+    """Drop local templates as soon as the Template Service invalidates them"""
+    while True:
+        try:
+            client = await get_redis()
+            pubsub = client.pubsub()
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Invalidations may have been missed while unsubscribed
+            _local_templates.clear()
+            try:
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        _local_templates.pop(message["data"], None)
+            finally:
+                await pubsub.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Template invalidation listener failed: {e}")
+            await asyncio.sleep(1)
+
+
 async def render_template(template_code: str, variables: Dict[str, str]) -> Optional[Dict]:
     """Render template with variables"""
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{settings.template_service_url}/api/v1/templates/{template_code}/render",
-                json={"variables": variables},
-                timeout=10.0
-            )
-            if response.status_code == 200:
-                data = response.json()
-                return data.get("data")
-            return None
+        if settings.template_render_mode == "local":
+            compiled = await get_compiled_template(template_code)
+            return compiled.render(variables) if compiled else None
+        key = (template_code, json.dumps(variables, sort_keys=True))
+        return await _render_batcher.get(key)
     except Exception as e:
         print(f"❌ Failed to render template: {e}")
         return None
@@ -1,20 +1,133 @@
-import httpx
-from typing import Optional, Dict
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, List, Tuple
 from app.config import settings
+from app.services.http_client import get_http_client
+from app.utils.batcher import RequestCoalescer
+from app.utils.cache import get_redis
+
+# Channel the User Service publishes user ids on when a user changes
+INVALIDATION_CHANNEL = "user:invalidate"
+
+# The only user fields workers use
+LOCAL_USER_FIELDS = ("id", "email", "push_token", "preferences")
+
+# Local user cache: user_id -> (fields, size in bytes, fetched at)
+_local_users: "OrderedDict[str, Tuple[Dict, int, float]]" = OrderedDict()
+_local_users_bytes = 0
+# Bumped on every invalidation, so a lookup that was in flight meanwhile
+# does not store what may already be stale
+_invalidation_epoch = 0
+
+
+async def _fetch_users(user_ids: List[str]) -> Dict[str, Dict]:
+    """Resolve many users with one call to the User Service batch endpoint"""
+    client = get_http_client("user")
+    response = await client.post("/api/v1/users/batch", json={"user_ids": user_ids})
+    response.raise_for_status()
+    users = response.json()["data"]["users"]
+    return {str(user["id"]): user for user in users}
+
+
+# Concurrent lookups from in-flight messages are coalesced into batch calls
+_user_batcher = RequestCoalescer(
+    _fetch_users,
+    max_batch_size=settings.user_batch_max_size,
+    max_wait=settings.user_batch_window_ms / 1000,
+)
+
+
+def _drop_local_user(user_id: str):
+    global _local_users_bytes
+    entry = _local_users.pop(user_id, None)
+    if entry:
+        _local_users_bytes -= entry[1]
+
+
+def _clear_local_users():
+    global _local_users_bytes, _invalidation_epoch
+    _local_users.clear()
+    _local_users_bytes = 0
+    _invalidation_epoch += 1
+
+
+def _get_local_user(user_id: str) -> Optional[Dict]:
+    entry = _local_users.get(user_id)
+    if not entry:
+        return None
+    user, _, fetched_at = entry
+    if time.monotonic() - fetched_at >= settings.local_user_cache_ttl_seconds:
+        _drop_local_user(user_id)
+        return None
+    _local_users.move_to_end(user_id)
+    return user
+
+
+def _store_local_user(user_id: str, user: Dict) -> Dict:
+    global _local_users_bytes
+    user = {field: user.get(field) for field in LOCAL_USER_FIELDS}
+    size = len(json.dumps(user, default=str))
+    if size > settings.local_user_cache_max_bytes:
+        return user
+    _drop_local_user(user_id)
+    _local_users[user_id] = (user, size, time.monotonic())
+    _local_users_bytes += size
+    while (
+        len(_local_users) > settings.local_user_cache_size
+        or _local_users_bytes > settings.local_user_cache_max_bytes
+    ):
+        _, (_, evicted_size, _) = _local_users.popitem(last=False)
+        _local_users_bytes -= evicted_size
+    return user
 
 
 async def get_user(user_id: str) -> Optional[Dict]:
-    """Fetch user from User Service"""
+    """
+    Fetch user from User Service
+
+    Found users are kept in a local LRU (by entries and bytes, for
+    `local_user_cache_ttl_seconds`) that the User Service invalidates
+    through Redis, so repeat recipients are resolved in-process.
+    """
+    user_id = str(user_id)
+    if not user_id.isdigit():
+        return None
+    if settings.local_user_cache_size > 0:
+        user = _get_local_user(user_id)
+        if user is not None:
+            return user
+    epoch = _invalidation_epoch
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{settings.user_service_url}/api/v1/users/{user_id}",
-                timeout=10.0
-            )
-            if response.status_code == 200:
-                data = response.json()
-                return data.get("data")
-            return None
+        user = await _user_batcher.get(user_id)
     except Exception as e:
         print(f"❌ Failed to fetch user: {e}")
         return None
+    if user is not None and settings.local_user_cache_size > 0 and epoch == _invalidation_epoch:
+        return _store_local_user(user_id, user)
+    return user
+
+
+async def listen_for_user_invalidations():
+    """Drop local users as soon as the User Service invalidates them"""
+    global _invalidation_epoch
+    while True:
+        try:
+            client = await get_redis()
+            pubsub = client.pubsub()
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Invalidations may have been missed while unsubscribed
+            _clear_local_users()
+            try:
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        _drop_local_user(message["data"])
+                        _invalidation_epoch += 1
+            finally:
+                await pubsub.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ User invalidation listener failed: {e}")
+            await asyncio.sleep(1)
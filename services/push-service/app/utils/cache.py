@@ -0,0 +1,17 @@
+import redis.asyncio as redis
+from typing import Optional
+from app.config import settings
+
+redis_client: Optional[redis.Redis] = None
+
+
+async def get_redis():
+    global redis_client
+    if redis_client is None:
+        redis_client = redis.Redis(
+            host=settings.redis_host,
+            port=settings.redis_port,
+            password=settings.redis_password if settings.redis_password else None,
+            decode_responses=True
+        )
+    return redis_client
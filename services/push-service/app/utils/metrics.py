@@ -0,0 +1,66 @@
+"""
+Lightweight in-process metrics for the worker
+"""
+import time
+from contextlib import contextmanager
+from typing import Awaitable, Dict, TypeVar
+
+T = TypeVar("T")
+
+
+class LatencyStats:
+    """Running latency aggregate for one pipeline stage"""
+
+    __slots__ = ("count", "total", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds: float):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+
+_latencies: Dict[str, LatencyStats] = {}
+
+
+def record_latency(stage: str, seconds: float):
+    """Record how long a stage took"""
+    stats = _latencies.get(stage)
+    if stats is None:
+        stats = _latencies[stage] = LatencyStats()
+    stats.add(seconds)
+
+
+@contextmanager
+def track_latency(stage: str):
+    """Record the latency of the wrapped block"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_latency(stage, time.perf_counter() - start)
+
+
+async def timed(stage: str, awaitable: Awaitable[T]) -> T:
+    """Await and record the latency of a coroutine (handy for tasks)"""
+    with track_latency(stage):
+        return await awaitable
+
+
+def snapshot(reset: bool = False) -> Dict[str, dict]:
+    """Per-stage count, average and max latency in milliseconds"""
+    data = {
+        stage: {
+            "count": stats.count,
+            "avg_ms": round(stats.total / stats.count * 1000, 2) if stats.count else 0.0,
+            "max_ms": round(stats.max * 1000, 2),
+        }
+        for stage, stats in _latencies.items()
+    }
+    if reset:
+        _latencies.clear()
+    return data
@@ -0,0 +1,131 @@
+"""
+Outbound rate limiting per delivery provider
+
+Providers enforce send quotas, and bursting past them only buys 421/429
+replies and retries. Each provider gets a token bucket of `rate` requests
+per second (up to `burst` at once) that lives in Redis, so all worker
+replicas share it. A process takes a small lease of tokens at a time and
+spends it locally.
+
+Callers queue up (FIFO) for tokens and wait instead of failing; only when
+the queue is already longer than `provider_rate_max_wait_seconds` worth
+of tokens is a call shed with ProviderUnavailableError, so the message is
+deferred. If Redis is unreachable the bucket is enforced per process.
+"""
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+
+from app.config import settings
+from app.utils.cache import get_redis
+from app.utils.circuit_breaker import ProviderUnavailableError
+
+# KEYS[1] = bucket; ARGV = capacity, refill per second, min tokens, max tokens
+# Grants up to ARGV[4] tokens if at least ARGV[3] are available, else none.
+# Returns {granted, tokens left}.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local min_tokens = tonumber(ARGV[3])
+local max_tokens = tonumber(ARGV[4])
+
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) / 1000 * rate)
+
+local granted = 0
+if tokens >= min_tokens then
+    granted = math.min(max_tokens, math.floor(tokens))
+    tokens = tokens - granted
+end
+
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(capacity / rate * 1000) + 1000)
+return {granted, tostring(tokens)}
+"""
+
+# Leased tokens not spent within this time are dropped
+LEASE_TTL_SECONDS = 1.0
+
+
+class ProviderRateLimiter:
+    """Shared token bucket of `rate` requests per second for one provider"""
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.lease_size = max(1, min(self.burst, int(rate * settings.provider_rate_lease_seconds)))
+        self._leased = 0
+        self._lease_expires = 0.0
+        self._lock = asyncio.Lock()
+        self._waiting = 0
+        self._script = None
+        # Per-process bucket used while Redis is unreachable
+        self._local_tokens = float(self.burst)
+        self._local_ts = time.monotonic()
+
+    async def acquire(self):
+        """Wait for one request token"""
+        if (self._waiting + 1) / self.rate > settings.provider_rate_max_wait_seconds:
+            raise ProviderUnavailableError(self.name, "send rate limit backlog full")
+
+        self._waiting += 1
+        try:
+            # asyncio.Lock wakes waiters in FIFO order
+            async with self._lock:
+                while True:
+                    if self._leased > 0 and self._lease_expires > time.monotonic():
+                        self._leased -= 1
+                        return
+                    granted, tokens_left = await self._take(self.lease_size)
+                    if granted:
+                        self._leased = granted
+                        self._lease_expires = time.monotonic() + LEASE_TTL_SECONDS
+                    else:
+                        await asyncio.sleep((1 - tokens_left) / self.rate)
+        finally:
+            self._waiting -= 1
+
+    async def _take(self, count: int) -> Tuple[int, float]:
+        try:
+            if self._script is None:
+                client = await get_redis()
+                self._script = client.register_script(TOKEN_BUCKET_SCRIPT)
+            granted, tokens_left = await self._script(
+                keys=[f"ratelimit:provider:{self.name}"],
+                args=[self.burst, self.rate, 1, count],
+            )
+            return int(granted), float(tokens_left)
+        except Exception as e:
+            print(f"⚠️ Shared rate limit for {self.name} unavailable, limiting locally: {e}")
+            return self._take_local(count)
+
+    def _take_local(self, count: int) -> Tuple[int, float]:
+        now = time.monotonic()
+        self._local_tokens = min(self.burst, self._local_tokens + (now - self._local_ts) * self.rate)
+        self._local_ts = now
+        if self._local_tokens < 1:
+            return 0, self._local_tokens
+        granted = min(count, int(self._local_tokens))
+        self._local_tokens -= granted
+        return granted, self._local_tokens
+
+
+_limiters: Dict[str, ProviderRateLimiter] = {}
+
+
+def get_provider_limiter(provider: str) -> Optional[ProviderRateLimiter]:
+    """Limiter for a provider with `<provider>_rate_limit_per_second` set, else None"""
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        rate = getattr(settings, f"{provider}_rate_limit_per_second", 0)
+        if rate <= 0:
+            return None
+        burst = getattr(settings, f"{provider}_rate_burst", 0) or int(rate)
+        limiter = _limiters[provider] = ProviderRateLimiter(provider, rate, burst)
+    return limiter
@@ -2,7 +2,9 @@
 RabbitMQ Consumer Worker - Entry point
 This runs as __main__ module
 """
+import asyncio
+
 from app.consumer import start_consumer
 
 if __name__ == "__main__":
-    start_consumer()
+    asyncio.run(start_consumer())
@@ -13,6 +13,14 @@ class Settings(BaseSettings):
     redis_port: int = 6379
     redis_password: str = ""
     
+    # Local (in-process) compiled template cache
+    local_template_cache_size: int = 1024
+    local_template_cache_ttl_seconds: int = 60
+    
+    # Batch rendering
+    render_batch_max_size: int = 5000
+    render_batch_stream_threshold: int = 500
+    
     # Logging
     log_level: str = "info"
     
@@ -1,7 +1,9 @@
+import asyncio
 from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.database import init_db
+from app.utils.cache import listen_for_invalidations
 
 
 @asynccontextmanager
@@ -10,8 +12,10 @@ async def lifespan(app: FastAPI):
     print("📦 Initializing database...")
     await init_db()
     print("✅ Database initialized!")
+    invalidation_listener = asyncio.create_task(listen_for_invalidations())
     yield
     print("👋 Shutting down Template Service...")
+    invalidation_listener.cancel()
 
 
 app = FastAPI(
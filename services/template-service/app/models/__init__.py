@@ -1,15 +1,25 @@
 from app.models.schemas import (
     TemplateCreate,
+    TemplateUpdate,
     TemplateResponse,
     TemplateRenderRequest,
     TemplateRenderResponse,
+    TemplateRenderItem,
+    TemplateBatchRenderRequest,
+    TemplateBatchRenderResult,
+    CompiledTemplateResponse,
 )
 from app.models.response import ApiResponse
 
 __all__ = [
     'TemplateCreate',
+    'TemplateUpdate',
     'TemplateResponse',
     'TemplateRenderRequest',
     'TemplateRenderResponse',
+    'TemplateRenderItem',
+    'TemplateBatchRenderRequest',
+    'TemplateBatchRenderResult',
+    'CompiledTemplateResponse',
     'ApiResponse',
 ]
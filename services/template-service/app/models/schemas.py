@@ -1,5 +1,5 @@
-from typing import Optional, List, Dict
-from pydantic import BaseModel
+from typing import Optional, List, Dict, Tuple
+from pydantic import BaseModel, model_validator
 from datetime import datetime
 
 
@@ -43,3 +43,55 @@ class TemplateRenderRequest(BaseModel):
 class TemplateRenderResponse(BaseModel):
     subject: Optional[str] = None
     body: str
+    missing_variables: List[str] = []
+    unused_variables: List[str] = []
+
+
+class TemplateRenderItem(BaseModel):
+    template_code: str
+    variables: Dict[str, str] = {}
+
+
+class TemplateBatchRenderRequest(BaseModel):
+    """Either a list of items, or one template with many variable sets"""
+    items: Optional[List[TemplateRenderItem]] = None
+    template_code: Optional[str] = None
+    variable_sets: Optional[List[Dict[str, str]]] = None
+
+    @model_validator(mode="after")
+    def check_form(self):
+        if self.items is None:
+            if self.template_code is None or self.variable_sets is None:
+                raise ValueError("Provide either items or template_code with variable_sets")
+        elif self.template_code is not None or self.variable_sets is not None:
+            raise ValueError("items cannot be combined with template_code/variable_sets")
+        return self
+
+    def render_items(self) -> List[TemplateRenderItem]:
+        if self.items is not None:
+            return self.items
+        return [
+            TemplateRenderItem(template_code=self.template_code, variables=variables)
+            for variables in self.variable_sets
+        ]
+
+
+class TemplateBatchRenderResult(BaseModel):
+    index: int
+    template_code: str
+    success: bool
+    data: Optional[TemplateRenderResponse] = None
+    error: Optional[str] = None
+
+
+class CompiledText(BaseModel):
+    parts: List[str]
+    slots: List[Tuple[int, str, str]]  # (part index, variable name, raw placeholder)
+
+
+class CompiledTemplateResponse(BaseModel):
+    template_code: str
+    version: int
+    subject: Optional[CompiledText] = None
+    body: CompiledText
+    variables: List[str]
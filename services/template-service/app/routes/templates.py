@@ -1,24 +1,69 @@
-from fastapi import APIRouter, HTTPException, Depends, Query
+import json
+from fastapi import APIRouter, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel import select
-from typing import Optional, List
+from typing import Optional, List, Dict
 from datetime import datetime
 
 from app.database import get_session
 from app.models.db_models import Template
 from app.models import (
     TemplateCreate,
+    TemplateUpdate,
     TemplateResponse,
     TemplateRenderRequest,
     TemplateRenderResponse,
+    TemplateBatchRenderRequest,
+    TemplateBatchRenderResult,
+    CompiledTemplateResponse,
     ApiResponse
 )
-from app.utils.template_engine import render_template
-from app.utils.cache import cache_template, get_cached_template, invalidate_cache
+from app.config import settings
+from app.utils.template_engine import CompiledNotificationTemplate, get_compiled_template
+from app.utils.cache import (
+    cache_template,
+    compiled_templates,
+    get_cached_template,
+    invalidate_cache,
+)
 
 router = APIRouter(prefix="/templates", tags=["templates"])
 
 
+async def load_compiled_template(
+    template_code: str,
+    session: AsyncSession
+) -> Optional[CompiledNotificationTemplate]:
+    """
+    Get a compiled active template
+
+    Looks in the in-process cache, then Redis, and only then the database,
+    filling the faster tiers on the way back.
+    """
+    compiled = compiled_templates.get(template_code)
+    if compiled:
+        return compiled
+    
+    template_dict = await get_cached_template(template_code)
+    if not template_dict:
+        result = await session.execute(
+            select(Template).where(
+                Template.template_code == template_code,
+                Template.is_active == True
+            )
+        )
+        template = result.scalar_one_or_none()
+        if not template:
+            return None
+        template_dict = template.model_dump()
+        await cache_template(template_code, template_dict)
+    
+    compiled = get_compiled_template(template_dict)
+    compiled_templates.set(template_code, compiled)
+    return compiled
+
+
 @router.post("/", response_model=ApiResponse[TemplateResponse])
 async def create_template(
     template: TemplateCreate,
@@ -105,37 +150,150 @@ async def list_templates(
     }
 
 
+@router.post("/render/batch", response_model=ApiResponse[List[TemplateBatchRenderResult]])
+async def render_templates_batch(
+    batch_request: TemplateBatchRenderRequest,
+    request: Request,
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Render many templates in one round-trip
+
+    Results keep the order of the request. Large batches (or clients
+    sending `Accept: application/x-ndjson`) get one JSON result per line
+    as they are rendered instead of a single response body.
+    """
+    items = batch_request.render_items()
+    if len(items) > settings.render_batch_max_size:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds {settings.render_batch_max_size} items"
+        )
+    
+    # Resolve each distinct template once
+    compiled: Dict[str, Optional[CompiledNotificationTemplate]] = {}
+    for item in items:
+        if item.template_code not in compiled:
+            compiled[item.template_code] = await load_compiled_template(item.template_code, session)
+    
+    def render_item(index: int, item) -> dict:
+        template = compiled[item.template_code]
+        if not template:
+            return {
+                "index": index,
+                "template_code": item.template_code,
+                "success": False,
+                "data": None,
+                "error": "Template not found",
+            }
+        return {
+            "index": index,
+            "template_code": item.template_code,
+            "success": True,
+            "data": template.render(item.variables),
+            "error": None,
+        }
+    
+    stream = (
+        len(items) > settings.render_batch_stream_threshold
+        or "application/x-ndjson" in request.headers.get("accept", "")
+    )
+    if stream:
+        def ndjson_lines():
+            for index, item in enumerate(items):
+                yield json.dumps(render_item(index, item)) + "\n"
+        
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+    
+    results = [render_item(index, item) for index, item in enumerate(items)]
+    failed = sum(1 for result in results if not result["success"])
+    return {
+        "success": True,
+        "message": f"Rendered {len(results) - failed} of {len(results)} templates",
+        "data": results
+    }
+
+
 @router.post("/{template_code}/render", response_model=ApiResponse[TemplateRenderResponse])
 async def render_template_endpoint(
     template_code: str,
     render_request: TemplateRenderRequest,
     session: AsyncSession = Depends(get_session)
 ):
-    # Get template
+    # Get template (in-process cache -> Redis -> database)
+    compiled = await load_compiled_template(template_code, session)
+    
+    if not compiled:
+        raise HTTPException(status_code=404, detail="Template not found")
+    
+    return {
+        "success": True,
+        "message": "Template rendered successfully",
+        "data": compiled.render(render_request.variables)
+    }
+
+
+@router.get("/{template_code}/compiled", response_model=ApiResponse[CompiledTemplateResponse])
+async def get_compiled_template_endpoint(
+    template_code: str,
+    request: Request,
+    response: Response,
+    session: AsyncSession = Depends(get_session)
+):
+    """
+    Get the compiled form of a template for local rendering
+
+    The ETag identifies the template version; a matching If-None-Match
+    gets an empty 304 so workers can revalidate cheaply.
+    """
+    compiled = await load_compiled_template(template_code, session)
+    
+    if not compiled:
+        raise HTTPException(status_code=404, detail="Template not found")
+    
+    etag = f'"{compiled.template_code}:{compiled.version}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    
+    response.headers["ETag"] = etag
+    return {
+        "success": True,
+        "message": "Compiled template retrieved",
+        "data": compiled.to_dict()
+    }
+
+
+@router.put("/{template_code}", response_model=ApiResponse[TemplateResponse])
+async def update_template(
+    template_code: str,
+    template_data: TemplateUpdate,
+    session: AsyncSession = Depends(get_session)
+):
     result = await session.execute(
-        select(Template).where(
-            Template.template_code == template_code,
-            Template.is_active == True
-        )
+        select(Template).where(Template.template_code == template_code)
     )
     template = result.scalar_one_or_none()
     
     if not template:
         raise HTTPException(status_code=404, detail="Template not found")
     
-    # Render template
-    rendered_body = render_template(template.body, render_request.variables)
-    rendered_subject = None
-    if template.subject:
-        rendered_subject = render_template(template.subject, render_request.variables)
+    # Update fields
+    for field, value in template_data.model_dump(exclude_unset=True).items():
+        setattr(template, field, value)
+    
+    # Every change is a new version so compiled copies are never reused
+    template.version += 1
+    template.updated_at = datetime.utcnow()
+    await session.commit()
+    await session.refresh(template)
+    
+    # Invalidate cache
+    await invalidate_cache(template_code)
     
     return {
         "success": True,
-        "message": "Template rendered successfully",
-        "data": {
-            "subject": rendered_subject,
-            "body": rendered_body
-        }
+        "message": "Template updated successfully",
+        "data": template
     }
 
 
@@ -1,11 +1,56 @@
+import asyncio
 import redis.asyncio as redis
 import json
-from typing import Optional
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
 from app.config import settings
 
 # Redis client
 redis_client: Optional[redis.Redis] = None
 
+# Pub/sub channel used to drop local copies in every process
+INVALIDATION_CHANNEL = "template:invalidate"
+
+
+class LocalTTLCache:
+    """Small in-process LRU cache with a per-entry TTL"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: Hashable):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+# Compiled templates by template_code (first tier, in front of Redis)
+compiled_templates = LocalTTLCache(
+    max_size=settings.local_template_cache_size,
+    ttl=settings.local_template_cache_ttl_seconds,
+)
+
 
 async def get_redis():
     global redis_client
@@ -23,7 +68,7 @@ async def cache_template(template_code: str, data: dict, ttl: int = 3600):
     """Cache template data"""
     client = await get_redis()
     key = f"template:{template_code}"
-    await client.setex(key, ttl, json.dumps(data))
+    await client.setex(key, ttl, json.dumps(data, default=str))
 
 
 async def get_cached_template(template_code: str) -> Optional[dict]:
@@ -35,7 +80,31 @@ async def get_cached_template(template_code: str) -> Optional[dict]:
 
 
 async def invalidate_cache(template_code: str):
-    """Invalidate cached template"""
+    """Invalidate cached template in Redis and in every process"""
+    compiled_templates.delete(template_code)
     client = await get_redis()
     key = f"template:{template_code}"
     await client.delete(key)
+    await client.publish(INVALIDATION_CHANNEL, template_code)
+
+
+async def listen_for_invalidations():
+    """Drop local compiled templates when another process invalidates them"""
+    while True:
+        try:
+            client = await get_redis()
+            pubsub = client.pubsub()
+            await pubsub.subscribe(INVALIDATION_CHANNEL)
+            # Invalidations may have been missed while unsubscribed
+            compiled_templates.clear()
+            try:
+                async for message in pubsub.listen():
+                    if message["type"] == "message":
+                        compiled_templates.delete(message["data"])
+            finally:
+                await pubsub.close()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"❌ Template invalidation listener failed: {e}")
+            await asyncio.sleep(1)
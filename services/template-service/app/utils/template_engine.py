@@ -1,5 +1,120 @@
 import re
-from typing import Dict
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+# {{variable}} placeholders, whitespace inside the braces is ignored
+PLACEHOLDER_PATTERN = re.compile(r"\{\{\s*([^{}]*?)\s*\}\}")
+
+COMPILED_CACHE_SIZE = 1024
+
+
+class CompiledTemplate:
+    """
+    Template text parsed once into literal segments and placeholder slots
+
+    Rendering fills the slots and joins the parts in a single pass.
+    Placeholders without a value are left as they were written.
+    """
+
+    __slots__ = ("source", "placeholders", "_parts", "_slots")
+
+    def __init__(self, source: str):
+        self.source = source
+        self._parts: List[str] = []
+        self._slots: List[Tuple[int, str, str]] = []
+
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(source):
+            self._parts.append(source[position:match.start()])
+            self._slots.append((len(self._parts), match.group(1), match.group(0)))
+            self._parts.append(match.group(0))
+            position = match.end()
+        self._parts.append(source[position:])
+
+        self.placeholders: FrozenSet[str] = frozenset(name for _, name, _ in self._slots)
+
+    def to_dict(self) -> dict:
+        """Compiled form shipped to workers that render locally"""
+        return {"parts": self._parts, "slots": self._slots}
+
+    def render(self, variables: Dict[str, str]) -> str:
+        if not self._slots:
+            return self.source
+        parts = self._parts.copy()
+        for index, name, raw in self._slots:
+            value = variables.get(name)
+            parts[index] = raw if value is None else str(value)
+        return "".join(parts)
+
+
+class CompiledNotificationTemplate:
+    """Compiled subject and body of one template version"""
+
+    __slots__ = ("template_code", "version", "subject", "body", "variables", "expected")
+
+    def __init__(
+        self,
+        template_code: str,
+        version: int,
+        subject: Optional[str],
+        body: str,
+        variables: Iterable[str] = (),
+    ):
+        self.template_code = template_code
+        self.version = version
+        self.subject = CompiledTemplate(subject) if subject else None
+        self.body = CompiledTemplate(body)
+        self.variables = list(variables or [])
+
+        # Declared variables plus anything actually referenced in the text
+        self.expected = set(self.variables) | self.body.placeholders
+        if self.subject:
+            self.expected |= self.subject.placeholders
+
+    def to_dict(self) -> dict:
+        return {
+            "template_code": self.template_code,
+            "version": self.version,
+            "subject": self.subject.to_dict() if self.subject else None,
+            "body": self.body.to_dict(),
+            "variables": self.variables,
+        }
+
+    def render(self, variables: Dict[str, str]) -> dict:
+        return {
+            "subject": self.subject.render(variables) if self.subject else None,
+            "body": self.body.render(variables),
+            "missing_variables": sorted(self.expected.difference(variables)),
+            "unused_variables": sorted(set(variables).difference(self.expected)),
+        }
+
+
+_compiled_cache: "OrderedDict[Tuple[str, int], CompiledNotificationTemplate]" = OrderedDict()
+
+
+def get_compiled_template(template: dict) -> CompiledNotificationTemplate:
+    """
+    Get the compiled form of a template dict, compiling it on first use
+
+    Cached by (template_code, version) in a bounded LRU.
+    """
+    key = (template["template_code"], template["version"])
+    compiled = _compiled_cache.get(key)
+    if compiled is not None:
+        _compiled_cache.move_to_end(key)
+        return compiled
+
+    compiled = CompiledNotificationTemplate(
+        template["template_code"],
+        template["version"],
+        template.get("subject"),
+        template["body"],
+        template.get("variables"),
+    )
+    _compiled_cache[key] = compiled
+    if len(_compiled_cache) > COMPILED_CACHE_SIZE:
+        _compiled_cache.popitem(last=False)
+    return compiled
 
 
 def render_template(template: str, variables: Dict[str, str]) -> str:
@@ -7,8 +122,4 @@ def render_template(template: str, variables: Dict[str, str]) -> str:
     Simple template variable substitution
     Replaces {{variable}} with actual values
     """
-    result = template
-    for key, value in variables.items():
-        pattern = r'\{\{\s*' + re.escape(key) + r'\s*\}\}'
-        result = re.sub(pattern, str(value), result)
-    return result
+    return CompiledTemplate(template).render(variables)
@@ -1,5 +1,5 @@
-from typing import Optional
-from pydantic import BaseModel, EmailStr
+from typing import List, Optional
+from pydantic import BaseModel, EmailStr, Field
 from datetime import datetime
 
 
@@ -46,3 +46,12 @@ class LoginResponse(BaseModel):
     access_token: str
     token_type: str = "bearer"
     user: UserResponse
+
+
+class UserBatchRequest(BaseModel):
+    user_ids: List[int] = Field(..., min_length=1, max_length=500)
+
+
+class UserBatchResponse(BaseModel):
+    users: List[UserResponse]
+    missing: List[int]
@@ -12,11 +12,19 @@ from app.models.schemas import (
     UserPreferenceUpdate,
     UserResponse,
     LoginResponse,
-    UserPreference
+    UserPreference,
+    UserBatchRequest,
+    UserBatchResponse,
 )
 from app.models.response import ApiResponse
 from app.utils.auth import hash_password, verify_password, create_access_token
-from app.utils.cache import cache_user, get_cached_user, invalidate_user_cache
+from app.utils.cache import (
+    cache_user,
+    cache_users,
+    get_cached_user,
+    get_cached_users,
+    invalidate_user_cache,
+)
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -88,6 +96,38 @@ async def login(
     }
 
 
+@router.post("/batch", response_model=ApiResponse[UserBatchResponse])
+async def get_users_batch(
+    batch: UserBatchRequest,
+    session: AsyncSession = Depends(get_session)
+):
+    """Get many users by ID (one MGET for cached users, one IN query for the rest)"""
+    user_ids = list(dict.fromkeys(batch.user_ids))
+    
+    # Try cache first
+    found = await get_cached_users(user_ids)
+    
+    # Query database for cache misses
+    misses = [user_id for user_id in user_ids if user_id not in found]
+    if misses:
+        result = await session.execute(
+            select(User).where(User.id.in_(misses), User.is_active == True)
+        )
+        fetched = {user.id: user.model_dump() for user in result.scalars().all()}
+        if fetched:
+            await cache_users(fetched)
+        found.update(fetched)
+    
+    return {
+        "success": True,
+        "message": f"Found {len(found)} of {len(user_ids)} users",
+        "data": {
+            "users": [found[user_id] for user_id in user_ids if user_id in found],
+            "missing": [user_id for user_id in user_ids if user_id not in found],
+        }
+    }
+
+
 @router.get("/{user_id}", response_model=ApiResponse[UserResponse])
 async def get_user(
     user_id: int,
@@ -1,10 +1,13 @@
 import redis.asyncio as redis
 import json
-from typing import Optional
+from typing import Dict, List, Optional
 from app.config import settings
 
 redis_client: Optional[redis.Redis] = None
 
+# Workers keep users in a local cache and drop them when their id is published here
+INVALIDATION_CHANNEL = "user:invalidate"
+
 
 async def get_redis():
     global redis_client
@@ -22,7 +25,7 @@ async def cache_user(user_id: int, data: dict, ttl: int = 3600):
     """Cache user data"""
     client = await get_redis()
     key = f"user:{user_id}"
-    await client.setex(key, ttl, json.dumps(data))
+    await client.setex(key, ttl, json.dumps(data, default=str))
 
 
 async def get_cached_user(user_id: int) -> Optional[dict]:
@@ -33,8 +36,29 @@ async def get_cached_user(user_id: int) -> Optional[dict]:
     return json.loads(data) if data else None
 
 
+async def cache_users(users: Dict[int, dict], ttl: int = 3600):
+    """Cache many users in one round-trip"""
+    client = await get_redis()
+    async with client.pipeline(transaction=False) as pipe:
+        for user_id, data in users.items():
+            pipe.setex(f"user:{user_id}", ttl, json.dumps(data, default=str))
+        await pipe.execute()
+
+
+async def get_cached_users(user_ids: List[int]) -> Dict[int, dict]:
+    """Get many cached users with a single MGET"""
+    client = await get_redis()
+    values = await client.mget([f"user:{user_id}" for user_id in user_ids])
+    return {
+        user_id: json.loads(value)
+        for user_id, value in zip(user_ids, values)
+        if value
+    }
+
+
 async def invalidate_user_cache(user_id: int):
-    """Invalidate cached user"""
+    """Invalidate cached user in Redis and in every worker"""
     client = await get_redis()
     key = f"user:{user_id}"
     await client.delete(key)
+    await client.publish(INVALIDATION_CHANNEL, str(user_id))